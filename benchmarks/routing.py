@@ -0,0 +1,203 @@
+"""
+Micro-benchmarks for the request router of score.http.
+
+Generates synthetic route tables of various sizes and measures the time
+required for sorting and finalizing the routes, for dispatching requests to
+the first and the last route of the table, for requests that no route can
+handle and for generating URLs.
+
+Usage::
+
+    python benchmarks/routing.py --output results.json
+    python benchmarks/routing.py --compare results.json
+
+The results are written as JSON, which allows comparing the numbers of
+different versions of this package using the ``--compare`` option. The JSON
+goes to stdout, unless an ``--output`` file is given, while the human-readable
+table is always printed to stderr. The script benchmarks the score.http found
+in the checkout it is located in.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# prefer the source tree containing this script over an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from score.ctx import init as init_score_ctx  # noqa: E402
+from score.http import init, RouterConfiguration  # noqa: E402
+from webob import Request  # noqa: E402
+
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+class Article:
+
+    def __init__(self, id, slug):
+        self.id = id
+        self.slug = slug
+
+
+def load_article(ctx, matches):
+    return {'article': Article(int(matches['article.id']),
+                               matches['article.slug'])}
+
+
+def mkrouter(size):
+    """
+    Creates a router with *size* routes and returns it along with a `dict`
+    mapping route names to tuples ``(path, url_args)``, where *path* is a path
+    matching the route and *url_args* are the arguments for generating it.
+
+    The routes are a mix of static pages, simple variables, dotted variables
+    and variables with custom regular expressions, distributed over several
+    sections of the url space.
+    """
+    router = RouterConfiguration()
+    samples = {}
+    for i in range(size):
+        section = 'section%d' % (i // 20)
+        kind = i % 4
+        name = 'route%d' % i
+        if kind == 0:
+            pattern = '/%s/page%d' % (section, i)
+            path = pattern
+            args = ()
+            callback = lambda ctx: 'page'  # noqa: E731
+        elif kind == 1:
+            pattern = '/%s/list%d/{slug}' % (section, i)
+            path = '/%s/list%d/some-slug' % (section, i)
+            args = ('some-slug',)
+            callback = lambda ctx, slug: slug  # noqa: E731
+        elif kind == 2:
+            pattern = '/%s/article%d/{article.slug}/{article.id>\\d+}' % (
+                section, i)
+            path = '/%s/article%d/some-article/42' % (section, i)
+            args = (Article(42, 'some-article'),)
+            callback = lambda ctx, article: 'article'  # noqa: E731
+        else:
+            pattern = '/%s/{year>\\d{4}}/{month>\\d{2}}/archive%d' % (
+                section, i)
+            path = '/%s/2019/05/archive%d' % (section, i)
+            args = ('2019', '05')
+            callback = lambda ctx, year, month: year  # noqa: E731
+        route = router.route(name, pattern)(callback)
+        if kind == 2:
+            route.match2vars(load_article)
+        samples[name] = (path, args)
+    return router, samples
+
+
+def mkconf(router):
+    ctx = init_score_ctx()
+    ctx._finalize(object())
+    conf = init({'router': router}, ctx=ctx)
+    conf._finalize()
+    return conf
+
+
+def measure(func, repeat, number):
+    """
+    Calls *func* *number* times in a row, *repeat* times. Returns the best
+    time per call in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        duration = (time.perf_counter() - start) / number
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def benchmark(size, repeat):
+    router, samples = mkrouter(size)
+    conf = mkconf(router)
+    results = {}
+    # cheap operations are repeated more often to get stable numbers
+    slow = max(1, 1000 // size)
+    fast = 1000
+    results['sorted_routes'] = measure(router.sorted_routes, repeat, slow)
+    results['finalize'] = measure(lambda: mkconf(router), repeat, slow)
+    names = list(conf.routes)
+    handled = list(name for name in names
+                   if conf.find_route_for(samples[name][0]).name == name)
+    first = Request.blank(samples[handled[0]][0])
+    last = Request.blank(samples[handled[-1]][0])
+    missing = Request.blank('/section0/missing/path/that/does/not/exist')
+    results['dispatch_first'] = measure(
+        lambda: conf.create_response(first), repeat, fast)
+    results['dispatch_last'] = measure(
+        lambda: conf.create_response(last), repeat, fast)
+    results['dispatch_404'] = measure(
+        lambda: conf.create_response(missing), repeat, fast)
+    ctx = conf.ctx.Context()
+    urlroutes = list(
+        (conf.route(name), samples[name][1]) for name in names[:100])
+
+    def generate_urls():
+        for route, args in urlroutes:
+            route.url(ctx, *args)
+
+    results['url'] = measure(generate_urls, repeat, 10) / len(urlroutes)
+    return results
+
+
+def compare(previous, current):
+    previous = dict(((r['routes'], r['benchmark']), r['seconds'])
+                    for r in previous['results'])
+    lines = []
+    for result in current['results']:
+        key = (result['routes'], result['benchmark'])
+        line = '%6d routes  %-16s %12.2fus' % (
+            key[0], key[1], result['seconds'] * 1e6)
+        if key in previous:
+            line += '  (%.2fx)' % (result['seconds'] / previous[key])
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='number of routes in the generated tables')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of measurements per benchmark')
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--compare', help='file containing earlier results')
+    args = parser.parse_args(args)
+    import score.http
+    report = {
+        'version': score.http.__version__,
+        'python': platform.python_version(),
+        'results': [],
+    }
+    for size in args.sizes:
+        for name, seconds in benchmark(size, args.repeat).items():
+            report['results'].append({
+                'routes': size,
+                'benchmark': name,
+                'seconds': seconds,
+            })
+    previous = {'results': []}
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+    print(compare(previous, report), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
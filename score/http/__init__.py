@@ -28,8 +28,10 @@
 from ._init import init, ConfiguredHttpModule, Route
 from ._conf import (RouterConfiguration, InitializationError, DependencyLoop,
                     DuplicateRouteDefinition)
+from ._static import StaticFileCache, MappedFiles
 
 __version__ = '0.5.6'
 
 __all__ = ('init', 'ConfiguredHttpModule', 'Route', 'RouterConfiguration',
-           'InitializationError', 'DependencyLoop', 'DuplicateRouteDefinition')
+           'InitializationError', 'DependencyLoop', 'DuplicateRouteDefinition',
+           'StaticFileCache', 'MappedFiles')
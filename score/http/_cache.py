@@ -0,0 +1,173 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+# Copyright © 2019 Necdet Can Ateşman, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """
+    A thread-safe mapping with an upper bound of *maxsize* entries, which
+    discards the least recently used entry whenever a new one would exceed
+    that bound. If a *ttl* is given, entries expire after that many seconds.
+
+    If a function *sizeof* is given, the bound applies to the sum of
+    ``sizeof(value)`` of all entries instead of their number. Values larger
+    than *maxsize* are not stored at all in that case.
+
+    The cache counts its :attr:`hits`, :attr:`misses`, :attr:`evictions` and
+    :attr:`expirations`, which can be inspected at any time (or reset via
+    :meth:`reset_stats`).
+    """
+
+    def __init__(self, maxsize, ttl=None, sizeof=None):
+        assert maxsize > 0
+        assert ttl is None or ttl > 0
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.currsize = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        if self.ttl is None:
+            return key in self._data
+        try:
+            return self._data[key][0] > time.monotonic()
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl is not None:
+                expires, value = value
+                if expires <= time.monotonic():
+                    self._remove(key)
+                    self.misses += 1
+                    self.expirations += 1
+                    return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = 1
+        if self.sizeof is not None:
+            size = self.sizeof(value)
+            if size > self.maxsize:
+                self.pop(key)
+                return
+        if self.ttl is not None:
+            value = (time.monotonic() + self.ttl, value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = value
+            self.currsize += size
+            while self.currsize > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._remove(key)
+        if self.ttl is not None:
+            value = value[1]
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currsize = 0
+
+    def discard(self, predicate):
+        """
+        Removes all entries, whose key satisfies given *predicate*. Returns
+        the number of removed entries.
+        """
+        with self._lock:
+            keys = list(key for key in self._data if predicate(key))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def _remove(self, key):
+        # must be called while holding the lock
+        value = self._data.pop(key)
+        if self.sizeof is None:
+            self.currsize -= 1
+        elif self.ttl is None:
+            self.currsize -= self.sizeof(value)
+        else:
+            self.currsize -= self.sizeof(value[1])
+        return value
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def stats(self):
+        """
+        A `dict` containing the current values of all counters.
+        """
+        return {
+            'size': len(self._data),
+            'currsize': self.currsize,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hit_rate,
+        }
+
+    @property
+    def hit_rate(self):
+        """
+        The ratio of :attr:`hits` to all lookups, or `None` if there were no
+        lookups yet.
+        """
+        lookups = self.hits + self.misses
+        if not lookups:
+            return None
+        return self.hits / lookups
@@ -26,14 +26,22 @@
 # the Licensee has his registered seat, an establishment or assets.
 
 from ._urltpl import UrlTemplate, PatternUrlTemplate
+from ._static import (
+    MappedFiles, PrecompressedFiles, StaticFileCache, resolve_path,
+    serve_file)
 from score.init import (
     InitializationError as ScoreInitializationError,
     DependencySolver, DependencyLoop as ScoreInitDependencyLoop)
-from itertools import permutations
+from itertools import combinations
+import heapq
 import functools
-import os
-import mimetypes
-from webob.exc import HTTPNotFound
+import hashlib
+import json
+
+
+# must be incremented whenever the sorting rules or the format of the cached
+# routing table change in a way not covered by the package version
+ROUTING_TABLE_FORMAT = 1
 
 
 class InitializationError(ScoreInitializationError):
@@ -71,6 +79,10 @@ class RouteConfiguration:
         self._vars2urlparts = None
         self.before = []
         self.after = []
+        self.methods = None
+        self.cache_urls = None
+        self.eager = ()
+        self.lazy = False
 
     @property
     def callback(self):
@@ -109,18 +121,37 @@ class RouterConfiguration:
     def __init__(self):
         self.routes = {}
 
-    def route(self, name, urltpl, *, before=[], after=[], tpl=None):
+    def route(self, name, urltpl, *, before=[], after=[], tpl=None,
+              methods=None, host=None, cache_urls=None, eager=(),
+              lazy=False):
         if isinstance(before, str) or not hasattr(before, '__iter__'):
             before = (before,)
         if isinstance(after, str) or not hasattr(after, '__iter__'):
             after = (after,)
+        if methods is not None:
+            if isinstance(methods, str):
+                methods = (methods,)
+            methods = set(method.upper() for method in methods)
+            if 'GET' in methods:
+                methods.add('HEAD')
+            methods = frozenset(methods)
         if not isinstance(urltpl, UrlTemplate):
-            urltpl = PatternUrlTemplate(urltpl)
+            urltpl = PatternUrlTemplate(urltpl, host=host)
+        elif host is not None:
+            raise ValueError('Cannot apply host pattern to existing '
+                             'UrlTemplate, pass the host to its constructor')
 
         def capture_route(func):
             if name in self.routes:
                 raise DuplicateRouteDefinition(name)
             route = RouteConfiguration(name, urltpl, tpl, func)
+            route.methods = methods
+            route.cache_urls = cache_urls
+            if isinstance(eager, str):
+                route.eager = (eager,)
+            else:
+                route.eager = tuple(eager)
+            route.lazy = lazy
             for other in before:
                 if isinstance(other, RouteConfiguration):
                     other = other.name
@@ -134,103 +165,176 @@ class RouterConfiguration:
         return capture_route
 
     def define_static_route(self, name, urltpl, rootdir, *,
-                            force_mimetype=None, **kwargs):
+                            force_mimetype=None, cache_control=None,
+                            precompressed=False, file_cache=None,
+                            mmap=None, **kwargs):
+        """
+        Defines a route serving the files in the folder *rootdir*. The *urltpl*
+        must contain a variable called ``path``, which will be resolved
+        relative to *rootdir*. The *rootdir* may also be a callable, which
+        will receive the context and the path and must return the folder.
+
+        The mimetype of the files is guessed from their names, unless
+        *force_mimetype* is given. The value of *cache_control* is sent as
+        ``Cache-Control`` header with every response.
+
+        Passing a truthy *precompressed* value will make the route deliver
+        precompressed variants of the files (like :file:`style.css.gz` for
+        :file:`style.css`) to clients accepting them. The value may also be
+        a list of supported content codings in the order of preference, the
+        default being ``['br', 'gzip']``.
+
+        The contents of small files can be kept in memory by passing a
+        :class:`StaticFileCache` as *file_cache*. The same cache may be
+        shared among several routes. Passing `True` creates a cache with
+        default settings for this route.
+
+        Large files can be served from memory-mapped buffers by passing a
+        :class:`MappedFiles` instance as *mmap* (or `True` for default
+        settings). This is only used, if the WSGI server does not provide a
+        ``wsgi.file_wrapper``, or if only parts of a file are requested.
+
+        All other keyword arguments are passed to :meth:`route`.
+        """
         mimetype = (None, None)
         if isinstance(force_mimetype, str):
             mimetype = (force_mimetype, None)
         elif force_mimetype:
-            mimetype = force_mimetype
+            mimetype = tuple(force_mimetype)
+        if precompressed is True:
+            precompressed = PrecompressedFiles()
+        elif precompressed:
+            if isinstance(precompressed, str):
+                precompressed = (precompressed,)
+            precompressed = PrecompressedFiles(precompressed)
+        else:
+            precompressed = None
+        if file_cache is True:
+            file_cache = StaticFileCache()
+        if mmap is True:
+            mmap = MappedFiles()
 
         @self.route(name, urltpl, **kwargs)
         def static_route(ctx, path):
             base = rootdir
             if callable(rootdir):
                 base = rootdir(ctx, path)
-            path = os.path.join(base, path)
-            if not os.path.commonprefix((base, path)).startswith(base):
-                # the path points outside of base
-                raise HTTPNotFound()
-            try:
-                ctx.http.response.app_iter = open(path, 'rb')
-            except (FileNotFoundError, IsADirectoryError):
-                raise HTTPNotFound()
-            content_type, content_encoding = mimetype
-            if not content_type:
-                guess = mimetypes.guess_type(path, strict=False)
-                if guess[0]:
-                    content_type, content_encoding = guess
-            ctx.http.response.content_type = content_type
-            if content_encoding:
-                ctx.http.response.content_encoding = content_encoding
+            serve_file(ctx, resolve_path(base, path), mimetype,
+                       cache_control=cache_control,
+                       precompressed=precompressed, file_cache=file_cache,
+                       mapped_files=mmap)
+
+    def fingerprint(self):
+        """
+        Provides a hash of everything, that influences the order of the
+        routes or their dispatching, i.e. their names, url templates,
+        ordering constraints and methods, as well as the version of this
+        module, which determines the sorting rules.
+        """
+        import score.http
+        definitions = list(
+            (route.name, repr(route.urltpl), route.before, route.after,
+             sorted(route.methods) if route.methods else None)
+            for route in self.routes.values())
+        definitions.sort()
+        data = json.dumps({
+            'version': score.http.__version__,
+            'format': ROUTING_TABLE_FORMAT,
+            'routes': definitions,
+        }, sort_keys=True).encode('UTF-8')
+        return hashlib.sha256(data).hexdigest()
 
     def sorted_routes(self):
-        try:
+        constrained = []
+        unconstrained = []
+        for route in self.routes.values():
+            if route.before or route.after:
+                constrained.append(route)
+            else:
+                unconstrained.append(route)
+        unconstrained.sort(key=lambda route: route.urltpl.sort_key)
+        self._check_ambiguities(unconstrained)
+        if not constrained:
+            return unconstrained
+        return self._insert_constrained(unconstrained, constrained)
+
+    def _check_ambiguities(self, sorted_routes):
+        """
+        Makes sure that all routes with equal sort keys also have equal url
+        templates. The order of two such routes cannot be determined and must
+        be defined explicitly using *before* or *after*.
+        """
+        start = 0
+        for end in range(1, len(sorted_routes) + 1):
+            if end < len(sorted_routes) and \
+                    not (sorted_routes[start].urltpl.sort_key <
+                         sorted_routes[end].urltpl.sort_key):
+                continue
+            group = sorted_routes[start:end]
+            for r1, r2 in combinations(group, 2):
+                if not r1.urltpl.equals(r2.urltpl):
+                    raise DependencyLoop([r1.name, r2.name, r1.name])
+            start = end
+
+    def _insert_constrained(self, unconstrained, constrained):
+        """
+        Merges the *constrained* routes into the already sorted list of
+        *unconstrained* ones. The relative order of the unconstrained routes
+        is retained and every constrained route is placed as close to its
+        natural position as its *before* and *after* constraints allow.
+        """
+        successors = dict((name, []) for name in self.routes)
+        predecessor_count = dict((name, 0) for name in self.routes)
+
+        def add_edge(first, second):
+            for name in (first, second):
+                if name not in self.routes:
+                    raise InitializationError(
+                        'Ordering constraint references unknown route "%s"' %
+                        name)
+            successors[first].append(second)
+            predecessor_count[second] += 1
+
+        # the unconstrained routes are already sorted, so a chain of edges is
+        # sufficient to describe their order.
+        for r1, r2 in zip(unconstrained, unconstrained[1:]):
+            add_edge(r1.name, r2.name)
+        for route in constrained:
+            for other in route.before:
+                add_edge(route.name, other)
+            for other in route.after:
+                add_edge(other, route.name)
+        # topological sort, always picking the route with the lowest sort key
+        # among the routes without unprocessed predecessors
+        position = dict((name, i) for i, name in enumerate(self.routes))
+        heap = []
+
+        def push(name):
+            heapq.heappush(heap, (self.routes[name].urltpl.sort_key,
+                                  position[name], name))
+
+        for name, count in predecessor_count.items():
+            if not count:
+                push(name)
+        result = []
+        while heap:
+            name = heapq.heappop(heap)[2]
+            result.append(self.routes[name])
+            for successor in successors[name]:
+                predecessor_count[successor] -= 1
+                if not predecessor_count[successor]:
+                    push(successor)
+        if len(result) < len(self.routes):
+            # let the dependency solver find the loop for the error message
             depsolv = DependencySolver()
-            constrained = set(r for r in self.routes.values()
-                              if r.before or r.after)
-            unconstrained = set(self.routes.values()) - constrained
-            for r1, r2 in permutations(unconstrained, 2):
-                if r1.urltpl.equals(r2.urltpl):
+            for name, count in predecessor_count.items():
+                if not count:
                     continue
-                if r1.urltpl < r2.urltpl:
-                    depsolv.add_dependency(r1.name, r2.name)
-                else:
-                    depsolv.add_dependency(r2.name, r1.name)
-            for route in constrained:
-                self._insert_constrained(depsolv, route)
-            for route in unconstrained:
-                # quite improbable case, but this scenario does exist (all
-                # routes unconstrained and equal, for example)
-                depsolv.add_dependency(route.name)
-            return list(self.routes[n]
-                        for n in reversed(depsolv.solve()))
-        except ScoreInitDependencyLoop as e:
-            raise DependencyLoop(e.loop)
-
-    def _insert_constrained(self, depsolv, route):
-        for before in route.before:
-            self._insert_before(depsolv, route, before)
-        for after in route.after:
-            self._insert_after(depsolv, route, after)
-
-    def _insert_before(self, depsolv, route, other):
-        route_predecessors = depsolv.direct_dependencies(route.name)
-        if other in route_predecessors:
-            depsolv.add_dependency(route.name, other)
-            depsolv.solve()  # raises ScoreInitDependencyLoop
-        other_predecessors = depsolv.direct_dependencies(other)
-        for other_predecessor in other_predecessors:
-            if route.urltpl < self.routes[other_predecessor].urltpl:
-                try:
-                    self._insert_before(depsolv, route, other_predecessor)
-                    break
-                except ScoreInitDependencyLoop:
-                    pass
-        else:
-            depsolv.add_dependency(route.name, other)
-            for other_predecessor in depsolv.direct_dependencies(other):
-                if self.routes[other_predecessor].urltpl < route.urltpl:
-                    if depsolv.has_direct_dependency(other_predecessor, other):
-                        depsolv.remove_dependency(other_predecessor, other)
-                        depsolv.add_dependency(other_predecessor, route.name)
-
-    def _insert_after(self, depsolv, route, other):
-        route_successors = depsolv.direct_dependents(route.name)
-        if other in route_successors:
-            depsolv.add_dependency(other, route.name)
-            depsolv.solve()  # raises ScoreInitDependencyLoop
-        other_successors = depsolv.direct_dependents(other)
-        for other_successor in other_successors:
-            if self.routes[other_successor].urltpl < route.urltpl:
-                try:
-                    self._insert_after(depsolv, route, other_successor)
-                    break
-                except ScoreInitDependencyLoop:
-                    pass
-        else:
-            depsolv.add_dependency(other, route.name)
-            for other_successor in depsolv.direct_dependents(other):
-                if route.urltpl < self.routes[other_successor].urltpl:
-                    if depsolv.has_direct_dependency(other, other_successor):
-                        depsolv.remove_dependency(other, other_successor)
-                        depsolv.add_dependency(route.name, other_successor)
+                for successor in successors[name]:
+                    depsolv.add_dependency(successor, name)
+            try:
+                depsolv.solve()
+            except ScoreInitDependencyLoop as e:
+                raise DependencyLoop(e.loop)
+            raise AssertionError('unreachable')
+        return result
@@ -0,0 +1,208 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+# Copyright © 2019 Necdet Can Ateşman, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import heapq
+import urllib
+
+
+class RoutingState:
+    """
+    Routing-related information about a request, which is computed only once
+    per request and shared by all routes tested during dispatch.
+
+    The :attr:`path` is the URL-decoded path of the request, which is what
+    the regular expressions of the routes are matched against. The
+    :attr:`segments` are the parts of that path between slashes. The
+    :attr:`method` is the HTTP method of the request and the :attr:`host` is
+    the lower-case host name without the port. Both may be `None`, if they
+    should not be taken into account.
+    """
+
+    __slots__ = ('path', 'segments', 'method', 'host', '_host_matches')
+
+    def __init__(self, path, method=None, host=None):
+        self.path = path
+        self.segments = path.split('/')
+        self.method = method
+        self.host = host
+        self._host_matches = {}
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(urllib.parse.unquote(request.path), request.method,
+                   request.domain.lower())
+
+    def match_host(self, urltpl):
+        """
+        Matches the :attr:`host` against the host pattern of given
+        :class:`.UrlTemplate`. Returns `True` for templates without host
+        pattern, the match object or `None` otherwise.
+        """
+        if urltpl.host is None:
+            return True
+        try:
+            return self._host_matches[urltpl.host]
+        except KeyError:
+            pass
+        match = None
+        if self.host is not None:
+            regex = urltpl.host_regex
+            if regex is None:
+                urltpl.compile()
+                regex = urltpl.host_regex
+            match = regex.match(self.host)
+        self._host_matches[urltpl.host] = match
+        return match
+
+
+class _Node:
+
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+
+
+class Dispatcher:
+    """
+    An index over a sorted list of routes, which is consulted for finding the
+    routes that might be able to handle a given (decoded) URL path.
+
+    The routes are stored in a trie of path segments using the
+    :attr:`literal prefix <score.http._urltpl.UrlTemplate.literal_prefix>` of
+    their :class:`.UrlTemplate`: A route with the template
+    ``/article/{article.id}`` can only match paths starting with
+    ``/article/``, so there is no need to test its regular expression against
+    the path ``/user/sirlancelot``.
+
+    The candidates are always provided in the order of the original list,
+    which means that callers can just test them one after another, exactly
+    like they would when iterating over all routes.
+
+    Routes without any variables (like ``/login``) describe exactly one path.
+    The dispatcher looks up all routes matching such a path once and stores
+    them in a `dict`, so requests to these paths need no trie walk at all.
+    The stored list still contains every other route matching the path, so a
+    higher-priority pattern route will still be tested first.
+    """
+
+    def __init__(self, routes, literals=None):
+        self.routes = list(routes)
+        self._root = _Node()
+        for priority, route in enumerate(self.routes):
+            node = self._root
+            for segment in self._prefix_segments(route.urltpl):
+                if segment not in node.children:
+                    node.children[segment] = _Node()
+                node = node.children[segment]
+            node.routes.append(priority)
+        if literals is not None:
+            self._literals = literals
+            return
+        self._literals = {}
+        for route in self.routes:
+            if route.urltpl.variables:
+                continue
+            path = route.urltpl.literal_prefix
+            if not path or path in self._literals:
+                continue
+            self._literals[path] = tuple(
+                candidate
+                for candidate in self._iter_candidates(path.split('/'))
+                if candidate.urltpl.regex.match(path))
+
+    def _prefix_segments(self, urltpl):
+        # only segments followed by a slash are complete: the template
+        # '/foo{bar}' can match the paths '/foo' and '/foobar', so we may only
+        # index it under '', whereas '/foo/{bar}' is indexed under '', 'foo'
+        return urltpl.literal_prefix.split('/')[:-1]
+
+    def subset(self, predicate):
+        """
+        Creates a new dispatcher for all routes, that satisfy given
+        *predicate*. This is cheaper than creating a new dispatcher from
+        scratch, as the new one can reuse the :attr:`literals` of this one.
+        """
+        routes = list(filter(predicate, self.routes))
+        literals = dict(
+            (path, tuple(filter(predicate, candidates)))
+            for path, candidates in self._literals.items())
+        return Dispatcher(routes, literals)
+
+    @property
+    def literals(self):
+        """
+        A `dict` mapping each path without variables to the `tuple` of routes
+        matching it. Can be passed to the constructor of another dispatcher
+        with the same routes to skip its computation.
+        """
+        return self._literals
+
+    def candidates(self, routing):
+        """
+        Provides an iterable of all routes, whose regular expression *might*
+        match the path of given :class:`RoutingState`, in order of their
+        priority.
+        """
+        try:
+            return self._literals[routing.path]
+        except KeyError:
+            return self._iter_candidates(routing.segments)
+
+    def matches(self, routing):
+        """
+        Yields a tuple ``(route, match)`` for every route, whose regular
+        expression matches the path of given :class:`RoutingState`, in order
+        of their priority.
+        """
+        path = routing.path
+        for route in self.candidates(routing):
+            match = route.urltpl.regex.match(path)
+            if match:
+                yield route, match
+
+    def _iter_candidates(self, segments):
+        node = self._root
+        buckets = []
+        if node.routes:
+            buckets.append(node.routes)
+        for i in range(len(segments) - 1):
+            node = node.children.get(segments[i])
+            if node is None:
+                break
+            if node.routes:
+                buckets.append(node.routes)
+        if not buckets:
+            return
+        if len(buckets) == 1:
+            priorities = buckets[0]
+        else:
+            priorities = heapq.merge(*buckets)
+        routes = self.routes
+        for priority in priorities:
+            yield routes[priority]
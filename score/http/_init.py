@@ -32,16 +32,23 @@ import re
 from score.init import ConfiguredModule
 import inspect
 import functools
+import operator
 from ._urltpl import MissingVariable, InvalidVariable
 from webob import Request, Response
 from webob.exc import (
-    HTTPMovedPermanently, HTTPFound, HTTPNotFound, HTTPException,
-    HTTPInternalServerError)
+    HTTPMovedPermanently, HTTPFound, HTTPNotFound, HTTPMethodNotAllowed,
+    HTTPException, HTTPInternalServerError)
 import logging
 from collections import OrderedDict
+import json
+import os
+import tempfile
 import urllib
 
 from ._conf import RouterConfiguration
+from ._dispatch import Dispatcher, RoutingState
+from ._cache import LRUCache
+from ._orm import EntityCache, mk_match2vars
 
 
 defaults = {
@@ -53,6 +60,14 @@ defaults = {
     'serve.ip': '0.0.0.0',
     'serve.port': 8080,
     'serve.threaded': False,
+    'routing.cache': False,
+    'routing.cache.size': 1000,
+    'routing.table_cache': None,
+    'url.cache': False,
+    'url.cache.size': 1000,
+    'orm.cache': False,
+    'orm.cache.size': 1000,
+    'orm.cache.ttl': 60,
 }
 
 
@@ -112,6 +127,49 @@ def init(confdict, ctx, orm=None, tpl=None):
         should increase its performance. Note that your application will need
         to be thread-safe_, if you want to enable this feature.
 
+    :confkey:`routing.cache` :confdefault:`False`
+        Whether the router should remember which routes matched a given path.
+        Subsequent requests to the same path will then skip all regular
+        expression tests and proceed with the remaining checks (i.e.
+        ``match2vars`` and preconditions) of the previously matching routes.
+
+    :confkey:`routing.cache.size` :confdefault:`1000`
+        The maximum number of paths to keep in the routing cache. The least
+        recently requested paths will be discarded first.
+
+    :confkey:`routing.table_cache` :confdefault:`None`
+        Path to a file, where the module may store the sorted route table. If
+        the names, url templates and ordering constraints of all routes are
+        unchanged on the next start, the module will read the order of the
+        routes from this file instead of sorting them again. Any change to the
+        route definitions will invalidate the file automatically.
+
+    :confkey:`url.cache` :confdefault:`False`
+        Whether generated URLs should be cached. The cache is keyed on the
+        route and all arguments passed to :meth:`Route.url`, which must be
+        hashable for the cache to apply. Since objects are usually hashed by
+        their identity, changing an object will not update the cached URLs to
+        that object: you will need to call
+        :meth:`ConfiguredHttpModule.invalidate_urls` in that case. See
+        :ref:`http_url_cache` for details.
+
+    :confkey:`url.cache.size` :confdefault:`1000`
+        The maximum number of URLs to keep in the URL cache.
+
+    :confkey:`orm.cache` :confdefault:`False`
+        Whether the objects, that are loaded automatically for routes with
+        annotated parameters (see :ref:`http_url_conversion`), should be
+        cached across requests. Objects are evicted from the cache as soon as
+        they are updated or deleted through the ORM. Changes to the database
+        made by other processes remain unnoticed until the objects expire,
+        though.
+
+    :confkey:`orm.cache.size` :confdefault:`1000`
+        The maximum number of objects to keep in the ORM cache.
+
+    :confkey:`orm.cache.ttl` :confdefault:`60`
+        The number of seconds an object may remain in the ORM cache.
+
     .. _werkzeug debugger: http://werkzeug.pocoo.org/docs/0.11/debug/#using-the-debugger
     .. _bind: http://www.xeams.com/bindtoaddress.htm
     .. _thread-safe: https://en.wikipedia.org/wiki/Thread_safety
@@ -145,15 +203,47 @@ def init(confdict, ctx, orm=None, tpl=None):
     ctx_member_url = conf['ctx.member.url']
     if ctx_member_url and ctx_member_url.strip().lower() == 'none':
         ctx_member_url = None
+    routing_cache_size = 0
+    if parse_bool(conf['routing.cache']):
+        routing_cache_size = int(conf['routing.cache.size'])
+        if routing_cache_size <= 0:
+            import score.http
+            raise ConfigurationError(score.http,
+                                     'Routing cache size must be positive')
+    url_cache_size = 0
+    if parse_bool(conf['url.cache']):
+        url_cache_size = int(conf['url.cache.size'])
+        if url_cache_size <= 0:
+            import score.http
+            raise ConfigurationError(score.http,
+                                     'URL cache size must be positive')
+    entity_cache_size = 0
+    entity_cache_ttl = None
+    if orm and parse_bool(conf['orm.cache']):
+        entity_cache_size = int(conf['orm.cache.size'])
+        entity_cache_ttl = float(conf['orm.cache.ttl'])
+        if entity_cache_size <= 0 or entity_cache_ttl <= 0:
+            import score.http
+            raise ConfigurationError(score.http,
+                                     'ORM cache size and ttl must be positive')
     return ConfiguredHttpModule(
         ctx, orm, tpl, routers, preroutes, error_handlers, exception_handlers,
         debug, conf['urlbase'], conf['serve.ip'], int(conf['serve.port']),
-        parse_bool(conf['serve.threaded']), ctx_member_http, ctx_member_url)
+        parse_bool(conf['serve.threaded']), ctx_member_http, ctx_member_url,
+        routing_cache_size=routing_cache_size,
+        routing_table_cache=conf['routing.table_cache'],
+        url_cache_size=url_cache_size,
+        entity_cache_size=entity_cache_size,
+        entity_cache_ttl=entity_cache_ttl)
 
 
 log = logging.getLogger('score.http.router')
 
 
+def _identity(value):
+    return value
+
+
 class Route:
     """
     A :term:`route` representation.
@@ -166,11 +256,34 @@ class Route:
         if isinstance(self.urltpl, str):
             self.urltpl = conf.url_class(self.urltpl)
         self.tpl = route.tpl
+        self.methods = route.methods
         self.callback = route.callback
         self.preconditions = route.preconditions
         self._match2vars = route._match2vars
         self._vars2url = route._vars2url
         self._vars2urlparts = route._vars2urlparts
+        self.cache_urls = route.cache_urls
+        self.eager = route.eager
+        self.lazy = route.lazy
+        self._url_cache_key = None
+        if callable(self.cache_urls):
+            self._url_cache_key = self.cache_urls
+            self.cache_urls = True
+        elif self.cache_urls is None:
+            # these functions might depend on more than just their arguments
+            self.cache_urls = not (self._vars2url or self._vars2urlparts)
+        # tuples (variable, root, path, getter) for all variables of the
+        # template: the variable "article.author.id" is retrieved by passing
+        # the value of the argument "article" to the getter for the path
+        # "author.id".
+        self._variable_getters = []
+        for name in self.urltpl.variables:
+            root, _, path = name.partition('.')
+            if path:
+                getter = operator.attrgetter(path)
+            else:
+                getter = _identity
+            self._variable_getters.append((name, root, path, getter))
 
     @property
     def callback(self):
@@ -179,37 +292,77 @@ class Route:
     @callback.setter
     def callback(self, callback):
         self._callback = callback
+        self._callback_params = tuple(
+            inspect.signature(callback).parameters)
         functools.update_wrapper(self, self.callback)
 
     def url(self, ctx, *args, **kwargs):
         """
         Creates the URL to this route with given arguments.
+
+        Passing ``_validate=False`` skips the validation of the variable
+        values against the regular expressions of the :class:`.UrlTemplate`.
+        """
+        options = self._url_options(kwargs)
+        return self._cached_url(ctx, args, kwargs, options)
+
+    def urls(self, ctx, objects, **kwargs):
+        """
+        Creates URLs to this route for each of the given *objects*. Every
+        object is passed as the single positional argument to :meth:`url`,
+        the keyword arguments are shared among all URLs. The options like
+        ``_query`` or ``_urlbase`` are thus evaluated only once.
+
+        Returns a generator, which can be consumed lazily, when creating
+        large amounts of URLs, like in a sitemap.
+        """
+        options = self._url_options(kwargs)
+        return (self._cached_url(ctx, (obj,), dict(kwargs), options)
+                for obj in objects)
+
+    def _url_options(self, kwargs):
+        """
+        Removes all options (i.e. the keyword arguments starting with an
+        underscore) from given *kwargs* and returns their evaluated values.
         """
         urlbase = ''
-        absolute = True
         if '_absolute' in kwargs:
-            absolute = kwargs['_absolute']
-            del kwargs['_absolute']
+            absolute = kwargs.pop('_absolute')
             assert '_relative' not in kwargs
-        elif '_relative' in kwargs:
-            absolute = not kwargs['_relative']
-            del kwargs['_relative']
-        query = ''
-        if '_query' in kwargs:
-            if kwargs['_query']:
-                query = urllib.parse.urlencode(kwargs['_query'])
-            del kwargs['_query']
-        anchor = ''
-        if '_anchor' in kwargs:
-            if kwargs['_anchor']:
-                anchor = '#' + urllib.parse.quote(kwargs['_anchor'])
-            del kwargs['_anchor']
+        else:
+            absolute = not kwargs.pop('_relative', False)
+        query = kwargs.pop('_query', None)
+        query = urllib.parse.urlencode(query) if query else ''
+        anchor = kwargs.pop('_anchor', None)
+        anchor = '#' + urllib.parse.quote(anchor) if anchor else ''
+        validate = kwargs.pop('_validate', True)
         if absolute:
-            try:
-                urlbase = kwargs['_urlbase']
-                del kwargs['_urlbase']
-            except KeyError:
-                urlbase = self.conf.urlbase
+            urlbase = kwargs.pop('_urlbase', self.conf.urlbase)
+        return absolute, urlbase, query, anchor, validate
+
+    def _cached_url(self, ctx, args, kwargs, options):
+        cache = self.conf.url_cache
+        if cache is None or not self.cache_urls:
+            return self._url(ctx, args, kwargs, options)
+        if self._url_cache_key is not None:
+            key_args = (self._url_cache_key(ctx, *args, **kwargs),)
+            key_kwargs = ()
+        else:
+            key_args = args
+            key_kwargs = kwargs.items()
+        try:
+            key = (self.name, key_args, frozenset(key_kwargs), options)
+            url = cache.get(key)
+        except TypeError:
+            # unhashable arguments
+            return self._url(ctx, args, kwargs, options)
+        if url is None:
+            url = self._url(ctx, args, kwargs, options)
+            cache.put(key, url)
+        return url
+
+    def _url(self, ctx, args, kwargs, options):
+        absolute, urlbase, query, anchor, validate = options
         if self._vars2url:
             url = self._vars2url(ctx, *args, **kwargs)
         else:
@@ -217,7 +370,20 @@ class Route:
                 kwargs.update(self._vars2urlparts(ctx, *args, **kwargs))
             self._args2kwargs(args, kwargs)
             variables = self._kwargs2vars(kwargs)
+            if not validate:
+                # only passed when needed, custom UrlTemplate classes might
+                # not support this parameter
+                variables['_validate'] = False
             url = self.urltpl.generate(**variables)
+            if absolute and self.urltpl.host is not None:
+                # routes on other hosts always need an absolute url. We are
+                # using the scheme of the urlbase, if there is one.
+                scheme = urllib.parse.urlsplit(urlbase).scheme
+                if scheme:
+                    scheme += ':'
+                url = scheme + '//' + \
+                    self.urltpl.generate_host(**variables) + url
+                urlbase = ''
         if urlbase:
             url = urlbase + url
         if query:
@@ -230,33 +396,34 @@ class Route:
     def _args2kwargs(self, args, kwargs):
         if not args:
             return
-        params = inspect.signature(self.callback).parameters
-        for i, name in enumerate(params):
+        for i, name in enumerate(self._callback_params):
             if name not in kwargs:
                 kwargs[name] = args[i - 1]
 
     def _kwargs2vars(self, kwargs):
         variables = {}
-        for name in self.urltpl.variables:
+        for name, root, path, getter in self._variable_getters:
             if name in kwargs:
                 variables[name] = kwargs[name]
                 continue
-            parts = name.split('.')
-            if parts[0] not in kwargs:
-                raise MissingVariable(parts[0])
-            current = kwargs[parts[0]]
-            for part in parts[1:]:
-                try:
-                    current = getattr(current, part)
-                except AttributeError:
-                    raise InvalidVariable(
-                        'Could not retrieve "%s" from %s' %
-                        ('.'.join(parts[1:]), kwargs[parts[0]]))
-            variables[name] = current
+            if root not in kwargs:
+                raise MissingVariable(root)
+            try:
+                variables[name] = getter(kwargs[root])
+            except AttributeError:
+                raise InvalidVariable(
+                    'Could not retrieve "%s" from %s' % (path, kwargs[root]))
         return variables
 
-    def _call_match2vars(self, ctx, match):
+    def _template_vars(self, ctx, routing, match):
         variables = self.urltpl.match2vars(ctx, match)
+        if self.urltpl.host is not None:
+            host_match = routing.match_host(self.urltpl)
+            variables.update(self.urltpl.host_match2vars(host_match))
+        return variables
+
+    def _call_match2vars(self, ctx, match):
+        variables = self._template_vars(ctx, ctx.http.routing, match)
         if self._match2vars:
             newvars = self._match2vars(ctx, variables)
             if newvars is None:
@@ -275,12 +442,25 @@ class Route:
                 return None
         return variables
 
-    def can_handle(self, request):
-        match = self.urltpl.regex.match(urllib.parse.unquote(request.path))
+    def accepts_method(self, method):
+        """
+        Whether this route is responsible for requests with given HTTP
+        *method*.
+        """
+        return self.methods is None or method in self.methods
+
+    def can_handle(self, request, routing=None):
+        if routing is None:
+            routing = RoutingState.from_request(request)
+        if not self.accepts_method(request.method):
+            return False
+        if not routing.match_host(self.urltpl):
+            return False
+        match = self.urltpl.regex.match(routing.path)
         if not match:
             return False
         ctx = self.conf.ctx.Context()
-        self.conf.set_ctx_http_member(ctx, request)
+        self.conf.set_ctx_http_member(ctx, request, routing)
         try:
             variables = self._call_match2vars(ctx, match)
             if variables is None:
@@ -293,12 +473,18 @@ class Route:
             pass
         return True
 
-    def extract_variables(self, request):
-        match = self.urltpl.regex.match(urllib.parse.unquote(request.path))
+    def extract_variables(self, request, routing=None):
+        if routing is None:
+            routing = RoutingState.from_request(request)
+        if not self.accepts_method(request.method):
+            return None
+        if not routing.match_host(self.urltpl):
+            return None
+        match = self.urltpl.regex.match(routing.path)
         if not match:
             return None
         ctx = self.conf.ctx.Context()
-        self.conf.set_ctx_http_member(ctx, request)
+        self.conf.set_ctx_http_member(ctx, request, routing)
         try:
             return self._call_match2vars(ctx, match)
         except HTTPException as exception:
@@ -306,9 +492,14 @@ class Route:
             # exception here
             return exception
 
-    def handle(self, ctx):
-        request = ctx.http.request
-        match = self.urltpl.regex.match(urllib.parse.unquote(request.path))
+    def handle(self, ctx, match=None):
+        if match is None:
+            routing = ctx.http.routing
+            if not routing.match_host(self.urltpl):
+                log.debug('  %s: No host match (%s)' %
+                          (self.name, self.urltpl.host))
+                return None
+            match = self.urltpl.regex.match(routing.path)
         if not match:
             log.debug('  %s: No regex match (%s)' %
                       (self.name, self.urltpl.regex.pattern))
@@ -345,7 +536,9 @@ class ConfiguredHttpModule(ConfiguredModule):
 
     def __init__(self, ctx, orm, tpl, routers, preroutes, error_handlers,
                  exception_handlers, debug, urlbase, host, port, threaded,
-                 ctx_member_http, ctx_member_url):
+                 ctx_member_http, ctx_member_url, *, routing_cache_size=0,
+                 routing_table_cache=None, url_cache_size=0,
+                 entity_cache_size=0, entity_cache_ttl=None):
         self.ctx = ctx
         self.orm = orm
         self.tpl = tpl
@@ -363,6 +556,18 @@ class ConfiguredHttpModule(ConfiguredModule):
         self.threaded = threaded
         self.ctx_member_http = ctx_member_http
         self.ctx_member_url = ctx_member_url
+        self.routing_table_cache = routing_table_cache
+        self.routing_cache = None
+        if routing_cache_size:
+            self.routing_cache = LRUCache(routing_cache_size)
+        self.url_cache = None
+        if url_cache_size:
+            self.url_cache = LRUCache(url_cache_size)
+        self.entity_cache = None
+        if entity_cache_size:
+            self.entity_cache = EntityCache(entity_cache_size,
+                                            entity_cache_ttl)
+            self.entity_cache.listen(orm.Base)
         if ctx_member_url:
             def constructor(ctx):
                 if hasattr(ctx, ctx_member_http):
@@ -383,88 +588,112 @@ class ConfiguredHttpModule(ConfiguredModule):
         return self.router.route(*args, **kwargs)
 
     def _finalize(self):
+        fingerprint = None
+        table = None
+        if self.routing_table_cache:
+            fingerprint = self.router.fingerprint()
+            table = self._load_routing_table(fingerprint)
+        if table:
+            sorted_routes = list(self.router.routes[name]
+                                 for name in table['order'])
+        else:
+            sorted_routes = self.router.sorted_routes()
         self.routes = OrderedDict((route.name, Route(self, route))
-                                  for route in self.router.sorted_routes())
+                                  for route in sorted_routes)
         for name, route in self.routes.items():
+            route.urltpl.compile()
             if not route._match2vars and self.orm:
                 route._match2vars = self._mk_match2vars(route)
+        if table:
+            literals = dict(
+                (path, tuple(self.routes[name] for name in names))
+                for path, names in table['literals'].items())
+            self.dispatcher = Dispatcher(self.routes.values(), literals)
+        else:
+            self.dispatcher = Dispatcher(self.routes.values())
+            if self.routing_table_cache:
+                self._store_routing_table(fingerprint)
+        self._method_dispatchers = {}
+        methods = set()
+        for route in self.routes.values():
+            if route.methods:
+                methods.update(route.methods)
+        if methods:
+            for method in methods:
+                self._method_dispatchers[method] = self.dispatcher.subset(
+                    lambda route: route.accepts_method(method))
+            # dispatcher for all other methods
+            self._method_dispatchers[None] = self.dispatcher.subset(
+                lambda route: route.methods is None)
+        self._literal_hosts = None
+        self._host_patterns = None
+        hosts = OrderedDict()
+        for route in self.routes.values():
+            if route.urltpl.host is not None:
+                hosts.setdefault(route.urltpl.host, route.urltpl)
+        if hosts:
+            # literal host names in lower case, mapped to the host patterns
+            # of the routes responsible for them
+            self._literal_hosts = {}
+            self._host_patterns = []
+            for host, urltpl in hosts.items():
+                if any(part.is_regex for part in urltpl.host_parts):
+                    self._host_patterns.append((host, urltpl.host_regex))
+                else:
+                    self._literal_hosts.setdefault(
+                        host.lower(), set()).add(host)
+            # host names are chosen by the client, so we must not remember
+            # an unlimited number of them
+            self._host_cache = LRUCache(1000)
+        self._dispatchers = {}
         if log.isEnabledFor(logging.DEBUG):
             msg = 'Compiled routes:'
             for name, route in self.routes.items():
                 msg += '\n - %s (%s)' % (name, route.urltpl)
             log.debug(msg)
 
-    def _mk_match2vars(self, route):
-        param2clsid = {}
-        parameters = inspect.signature(route.callback).parameters
-        test_redirect = False
-        for i, (name, param) in enumerate(parameters.items()):
-            if i == 0:
-                continue
-            if param.annotation is inspect.Parameter.empty:
-                return
-            cls = param.annotation
-            if not issubclass(cls, self.orm.Base):
-                return
-            if ('%s.id' % name) in route.urltpl.variables:
-                idcol = 'id'
-            else:
-                table = cls.__table__
-                for var in route.urltpl.variables:
-                    match = re.match(r'%s\.([^.]+)$' % name, var)
-                    if not match:
-                        continue
-                    column_name = match.group(1)
-                    column = table.columns.get(column_name)
-                    if column is None:
-                        parent = cls
-                        while parent.__score_sa_orm__['parent']:
-                            parent = parent.__score_sa_orm__['parent']
-                            column = parent.__table__.columns.get(column_name)
-                            if column is not None:
-                                break
-                        else:
-                            import warnings
-                            warnings.warn(
-                                'Route "%s" references column "%s.%s", '
-                                'which does not exist.' % (
-                                    route.name, cls.__name__, column_name))
-                            return
-                    if column.unique:
-                        idcol = column_name
-                        break
-                else:
-                    return
-            if not test_redirect:
-                for var in route.urltpl.variables:
-                    if var == '%s.%s' % (name, idcol):
-                        continue
-                    if var.startswith('%s.' % name):
-                        test_redirect = True
-                        break
-            param2clsid[name] = (cls, idcol)
-        if not param2clsid:
-            return
+    def _load_routing_table(self, fingerprint):
+        try:
+            with open(self.routing_table_cache, encoding='UTF-8') as file:
+                table = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warning('Could not read routing table cache %s: %s' %
+                        (self.routing_table_cache, e))
+            return None
+        if not isinstance(table, dict) or \
+                table.get('fingerprint') != fingerprint:
+            log.debug('Routing table cache is outdated')
+            return None
+        return table
+
+    def _store_routing_table(self, fingerprint):
+        table = {
+            'fingerprint': fingerprint,
+            'order': list(self.routes),
+            'literals': dict(
+                (path, list(route.name for route in routes))
+                for path, routes in self.dispatcher.literals.items()),
+        }
+        folder = os.path.dirname(os.path.abspath(self.routing_table_cache))
+        try:
+            # write to a temporary file first to make sure that concurrently
+            # starting workers never see a partially written file
+            fd, tmpfile = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            try:
+                with open(fd, 'w', encoding='UTF-8') as file:
+                    json.dump(table, file)
+                os.replace(tmpfile, self.routing_table_cache)
+            except Exception:
+                os.unlink(tmpfile)
+                raise
+        except OSError as e:
+            log.warning('Could not write routing table cache %s: %s' %
+                        (self.routing_table_cache, e))
 
-        def match2vars(ctx, matches):
-            result = {}
-            for var, (cls, idcol) in param2clsid.items():
-                id = matches['%s.%s' % (var, idcol)]
-                result[name] = self.orm.get_session(ctx).query(cls).\
-                    filter(getattr(cls, idcol) == id).\
-                    first()
-                if result[name] is None:
-                    return
-            if test_redirect and ctx.http.request.method == 'GET':
-                realpath = urllib.parse.unquote(
-                    route.url(ctx, _relative=True, **result))
-                if urllib.parse.unquote(ctx.http.request.path) != realpath:
-                    # need to create the url a second time to incorporate the
-                    # query string
-                    ctx.http.redirect(route.url(
-                        ctx, _query=ctx.http.request.GET, **result))
-            return result
-        return match2vars
+    def _mk_match2vars(self, route):
+        return mk_match2vars(self, route)
 
     def url(self, ctx, route, *args, **kwargs):
         """
@@ -472,6 +701,40 @@ class ConfiguredHttpModule(ConfiguredModule):
         """
         return self.route(route).url(ctx, *args, **kwargs)
 
+    def invalidate_urls(self, route=None, obj=None):
+        """
+        Removes URLs from the URL cache (see :confkey:`url.cache`). Passing a
+        *route* (or its name) removes only URLs to that route, passing an
+        *obj* removes only URLs that were generated using that object as an
+        argument. Without any arguments, the whole cache is cleared.
+
+        Returns the number of removed URLs.
+        """
+        if self.url_cache is None:
+            return 0
+        if isinstance(route, Route):
+            route = route.name
+        if route is None and obj is None:
+            count = len(self.url_cache)
+            self.url_cache.clear()
+            return count
+
+        def matches(key):
+            name, args, kwargs, _ = key
+            if route is not None and name != route:
+                return False
+            if obj is None:
+                return True
+            return any(arg is obj for arg in args) or \
+                any(value is obj for _, value in kwargs)
+        return self.url_cache.discard(matches)
+
+    def urls(self, ctx, route, objects, **kwargs):
+        """
+        Shortcut for ``route(route).urls(ctx, objects, **kwargs)``.
+        """
+        return self.route(route).urls(ctx, objects, **kwargs)
+
     def get_serve_runners(self):
         if not hasattr(self, '_serve_runners'):
             import score.serve
@@ -547,28 +810,73 @@ class ConfiguredHttpModule(ConfiguredModule):
         return app
 
     def find_route_for(self, request_or_url):
-        if isinstance(request_or_url, Request):
-            request = request_or_url
-        else:
-            request = Request.blank(request_or_url)
-        for route in self.routes.values():
-            if route.can_handle(request):
-                return route
-        return None
+        return self.find_route_and_args_for(request_or_url)[0]
 
     def find_route_and_args_for(self, request_or_url):
         if isinstance(request_or_url, Request):
             request = request_or_url
         else:
             request = Request.blank(request_or_url)
-        for route in self.routes.values():
-            result = route.extract_variables(request)
-            if result is not None:
-                return route, result
+        return self._find_route(request, RoutingState.from_request(request))
+
+    def _find_route(self, request, routing):
+        """
+        Determines the route, that would handle given *request*, without
+        actually invoking it. Returns a tuple ``(route, variables)``.
+
+        All routes are tested within the same context object. If the
+        match2vars function of a route raises an HTTPException, the route is
+        considered responsible for the request and the exception is returned
+        in place of the *variables*.
+        """
+        dispatcher = self._dispatcher_for(routing)
+        with self.ctx.Context() as ctx:
+            self.set_ctx_http_member(ctx, request, routing)
+            for route, match in dispatcher.matches(routing):
+                try:
+                    variables = route._call_match2vars(ctx, match)
+                except HTTPException as exception:
+                    return route, exception
+                if variables is not None:
+                    return route, variables
         return None, None
 
-    def set_ctx_http_member(self, ctx, request):
-        setattr(ctx, self.ctx_member_http, Http(self, ctx, request))
+    def classify(self, urls, *, method='GET', match_only=False):
+        """
+        Determines the routes responsible for many URLs at once. Yields a
+        tuple ``(url, route, variables)`` for each of the given *urls*, where
+        *route* and *variables* are the values :meth:`find_route_and_args_for`
+        would return for that URL. The URLs may be relative (``/foo``) or
+        absolute (``http://example.net/foo``).
+
+        Passing a truthy *match_only* will skip all ``match2vars`` functions
+        and preconditions. The *route* will then be the first route, whose
+        regular expressions matched, and the *variables* will contain the raw
+        strings extracted from the URL (including dotted names like
+        ``article.id``). This mode does not create any context objects and
+        is thus much faster.
+        """
+        for url in urls:
+            if not match_only:
+                request = Request.blank(url, method=method)
+                yield (url,) + self._find_route(
+                    request, RoutingState.from_request(request))
+                continue
+            parts = urllib.parse.urlsplit(url)
+            # the fallback host name is the same Request.blank() uses
+            routing = RoutingState(urllib.parse.unquote(parts.path or '/'),
+                                   method, parts.hostname or 'localhost')
+            for route, match in self._dispatcher_for(routing).matches(routing):
+                yield url, route, route._template_vars(None, routing, match)
+                break
+            else:
+                yield url, None, None
+
+    def set_ctx_http_member(self, ctx, request, routing=None):
+        http = Http(self, ctx, request)
+        if routing is not None:
+            http.routing = routing
+        setattr(ctx, self.ctx_member_http, http)
 
     def create_response(self, request):
         ctx = self.ctx.Context()
@@ -587,12 +895,15 @@ class ConfiguredHttpModule(ConfiguredModule):
             if isinstance(result, Response):
                 ctx.http.response = result
             else:
-                for name, route in self.routes.items():
-                    if route.handle(ctx):
+                # preroutes may have altered the request path, so the
+                # routing state must not be computed any earlier
+                routing = ctx.http.routing = RoutingState.from_request(request)
+                for route, match in self._matches(routing):
+                    if route.handle(ctx, match):
                         break
                 else:
                     ctx.http.response = self.create_error_response(
-                        ctx, HTTPNotFound())
+                        ctx, self._mk_no_route_error(routing))
         except Exception as e:
             for exc in self.exception_handlers:
                 # let's see if we have a dedicated exception handler for this
@@ -614,6 +925,81 @@ class ConfiguredHttpModule(ConfiguredModule):
         ctx.destroy()
         return response
 
+    def _dispatch_key(self, routing):
+        """
+        Determines which subset of the routes is relevant for given
+        :class:`RoutingState`: the routes for its HTTP method and the routes
+        for its host.
+        """
+        method = routing.method
+        if method not in self._method_dispatchers:
+            method = None
+        if self._host_patterns is None:
+            return method, None
+        hosts = self._host_cache.get(routing.host)
+        if hosts is None:
+            hosts = set()
+            hosts.update(self._literal_hosts.get(routing.host, ()))
+            if routing.host is not None:
+                for host, regex in self._host_patterns:
+                    if regex.match(routing.host):
+                        hosts.add(host)
+            hosts = frozenset(hosts)
+            self._host_cache.put(routing.host, hosts)
+        return method, hosts
+
+    def _dispatcher(self, key):
+        try:
+            return self._dispatchers[key]
+        except KeyError:
+            pass
+        method, hosts = key
+        dispatcher = self._method_dispatchers.get(method, self.dispatcher)
+        if hosts is not None:
+            dispatcher = dispatcher.subset(
+                lambda route: route.urltpl.host is None or
+                route.urltpl.host in hosts)
+        self._dispatchers[key] = dispatcher
+        return dispatcher
+
+    def _dispatcher_for(self, routing):
+        return self._dispatcher(self._dispatch_key(routing))
+
+    def _matches(self, routing):
+        key = self._dispatch_key(routing)
+        dispatcher = self._dispatcher(key)
+        if self.routing_cache is None:
+            return dispatcher.matches(routing)
+        key = (key, routing.path)
+        matches = self.routing_cache.get(key)
+        if matches is None:
+            matches = tuple(dispatcher.matches(routing))
+            self.routing_cache.put(key, matches)
+        return matches
+
+    def _mk_no_route_error(self, routing):
+        """
+        Creates the exception to send, when none of the routes handled a
+        request: If the path would have matched routes for other HTTP methods,
+        the client will receive a 405 response listing these methods.
+        """
+        if not self._method_dispatchers:
+            return HTTPNotFound()
+        allowed = set()
+        for route, match in self.dispatcher.matches(routing):
+            if not routing.match_host(route.urltpl):
+                continue
+            if route.methods is None:
+                # this route accepted the method, but could not handle the
+                # request, so there is no other method to suggest
+                return HTTPNotFound()
+            allowed.update(route.methods)
+        if not allowed or routing.method in allowed:
+            return HTTPNotFound()
+        return HTTPMethodNotAllowed(headers={
+            'Allow': ', '.join(sorted(allowed)),
+        })
+
     def create_failsafe_response(self, request, error=None):
         try:
             with self.ctx.Context() as ctx:
@@ -669,6 +1055,7 @@ class Http:
         self._conf = conf
         self._ctx = ctx
         self._response = None
+        self._routing = None
         self.req = self.request = request
         self.urlbase = None
 
@@ -692,9 +1079,28 @@ class Http:
     def response(self, value):
         self._response = value
 
+    @property
+    def routing(self):
+        """
+        The :class:`RoutingState` of the request, which contains the decoded
+        path. Created on first access, unless the router has already set it.
+        """
+        if self._routing is None:
+            self._routing = RoutingState.from_request(self.request)
+        return self._routing
+
+    @routing.setter
+    def routing(self, value):
+        self._routing = value
+
     def url(self, *args, **kwargs):
         if '_urlbase' not in kwargs and self.urlbase:
             kwargs['_urlbase'] = self.urlbase
         return self._conf.url(self._ctx, *args, **kwargs)
 
+    def urls(self, *args, **kwargs):
+        if '_urlbase' not in kwargs and self.urlbase:
+            kwargs['_urlbase'] = self.urlbase
+        return self._conf.urls(self._ctx, *args, **kwargs)
+
     res = response
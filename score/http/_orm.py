@@ -0,0 +1,393 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+# Copyright © 2019 Necdet Can Ateşman, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+from ._cache import LRUCache
+import inspect
+import operator
+import re
+import threading
+import urllib
+import warnings
+
+
+def mk_match2vars(conf, route):
+    """
+    Creates a ``match2vars`` function for given :class:`.Route`, which loads
+    all ORM entities the route's callback expects. The callback must provide
+    annotations of all its parameters (except the context) and every
+    annotation must be a subclass of the ORM's ``Base`` class. Returns `None`
+    if the route does not fulfill these requirements.
+
+    All entities are loaded in a single query. The relationships listed in
+    the *eager* parameter of the route are loaded in the same query, too.
+    Entities found in the configured :class:`EntityCache` are not queried at
+    all.
+
+    If the route was defined with ``lazy=True``, the query will only load the
+    columns required for finding the entities and testing their URLs. All
+    other columns are loaded with a single query on first access.
+    """
+    from sqlalchemy import true
+    from sqlalchemy.orm import aliased
+    param2clsid = _find_entities(conf.orm, route)
+    if not param2clsid:
+        return
+    test_redirect = False
+    for var in route.urltpl.variables:
+        name, _, column = var.partition('.')
+        if name in param2clsid and column != param2clsid[name][1]:
+            test_redirect = True
+            break
+    is_canonical = None
+    if test_redirect:
+        is_canonical = _mk_canonical_test(route, param2clsid)
+    entities = []
+    for name, (cls, idcol) in param2clsid.items():
+        entity = cls
+        if any(cls is other for _, other, _, _ in entities):
+            # querying the same table twice requires an alias
+            entity = aliased(cls)
+        entities.append((name, cls, entity, idcol))
+    options = _mk_eager_options(route, entities)
+    if route.lazy:
+        options.extend(_mk_lazy_options(route, entities))
+
+    def load(session, entities, matches):
+        query = session.query(*(entity for _, _, entity, _ in entities))
+        for _, _, entity, _ in entities[1:]:
+            # every entity is filtered by a unique column below, so this
+            # cross join yields at most one row
+            query = query.join(entity, true())
+        for name, _, entity, idcol in entities:
+            query = query.filter(
+                getattr(entity, idcol) == matches['%s.%s' % (name, idcol)])
+        names = set(name for name, _, _, _ in entities)
+        if len(names) == len(param2clsid):
+            query = query.options(*(option for _, option in options))
+        else:
+            query = query.options(*(option for name, option in options
+                                    if name in names))
+        row = query.first()
+        if row is None or len(entities) > 1:
+            return row
+        return (row,)
+
+    def match2vars(ctx, matches):
+        session = conf.orm.get_session(ctx)
+        cache = conf.entity_cache
+        result = {}
+        missing = entities
+        if cache is not None:
+            missing = []
+            for entry in entities:
+                name, cls, _, idcol = entry
+                instance = cache.get(
+                    session, cls, idcol, matches['%s.%s' % (name, idcol)])
+                if instance is None:
+                    missing.append(entry)
+                else:
+                    result[name] = instance
+        if missing:
+            row = load(session, missing, matches)
+            if row is None:
+                return
+            for (name, cls, _, idcol), instance in zip(missing, row):
+                result[name] = instance
+                if cache is not None:
+                    cache.put(cls, idcol, matches['%s.%s' % (name, idcol)],
+                              instance)
+                if route.lazy:
+                    _expire_unloaded(session, instance)
+        if test_redirect and ctx.http.request.method == 'GET' and \
+                not is_canonical(ctx, matches, result):
+            ctx.http.redirect(route.url(
+                ctx, _query=ctx.http.request.GET, **result))
+        return result
+    return match2vars
+
+
+def _mk_canonical_test(route, param2clsid):
+    """
+    Creates a function, which determines whether the current request was
+    made to the canonical URL of the loaded entities. It accepts the context,
+    the matched variables and the `dict` of loaded entities.
+
+    The function compares the matched variables to the attributes of the
+    entities directly. Only if the route has its own ways of creating URLs
+    (i.e. ``vars2url`` or ``vars2urlparts``), or if its template is not a
+    :class:`.PatternUrlTemplate`, the function will need to generate the URL
+    of the entities and compare it to the requested path.
+    """
+    parts = getattr(route.urltpl, 'parts', None)
+    if route._vars2url or route._vars2urlparts or parts is None:
+        def is_canonical(ctx, matches, entities):
+            realpath = urllib.parse.unquote(
+                route.url(ctx, _relative=True, **entities))
+            return ctx.http.routing.path == realpath
+        return is_canonical
+    checks = []
+    for var in set(part.variable for part in parts if part.variable):
+        name, _, path = var.partition('.')
+        if name in param2clsid and path:
+            checks.append((var, name, operator.attrgetter(path)))
+
+    def is_canonical(ctx, matches, entities):
+        for var, name, getter in checks:
+            try:
+                value = getter(entities[name])
+            except AttributeError:
+                return False
+            if str(value) != matches[var]:
+                return False
+        return True
+    return is_canonical
+
+
+def _find_entities(orm, route):
+    """
+    Returns a `dict` mapping parameter names of the route's callback to
+    tuples ``(cls, idcol)``, where *idcol* is the name of a unique column of
+    the ORM class *cls*, that is part of the route's url template.
+    """
+    param2clsid = {}
+    parameters = inspect.signature(route.callback).parameters
+    for i, (name, param) in enumerate(parameters.items()):
+        if i == 0:
+            continue
+        if param.annotation is inspect.Parameter.empty:
+            return
+        cls = param.annotation
+        if not isinstance(cls, type) or not issubclass(cls, orm.Base):
+            return
+        if ('%s.id' % name) in route.urltpl.variables:
+            idcol = 'id'
+        else:
+            table = cls.__table__
+            for var in route.urltpl.variables:
+                match = re.match(r'%s\.([^.]+)$' % re.escape(name), var)
+                if not match:
+                    continue
+                column_name = match.group(1)
+                column = table.columns.get(column_name)
+                if column is None:
+                    parent = cls
+                    while parent.__score_sa_orm__['parent']:
+                        parent = parent.__score_sa_orm__['parent']
+                        column = parent.__table__.columns.get(column_name)
+                        if column is not None:
+                            break
+                    else:
+                        warnings.warn(
+                            'Route "%s" references column "%s.%s", '
+                            'which does not exist.' % (
+                                route.name, cls.__name__, column_name))
+                        return
+                if column.unique:
+                    idcol = column_name
+                    break
+            else:
+                return
+        param2clsid[name] = (cls, idcol)
+    return param2clsid
+
+
+def _mk_lazy_options(route, entities):
+    """
+    Creates the ``(name, option)`` tuples for a route with ``lazy=True``,
+    which restrict the loaded columns of each entity to the ones referenced
+    in the route's url template.
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import Load
+    options = []
+    for name, cls, entity, idcol in entities:
+        columns = set(attr.key for attr in inspect(cls).column_attrs)
+        load = [idcol]
+        for var in route.urltpl.variables:
+            root, _, path = var.partition('.')
+            if root == name and path in columns and path not in load:
+                load.append(path)
+        attrs = list(getattr(entity, column) for column in load)
+        options.append((name, Load(entity).load_only(*attrs)))
+    return options
+
+
+def _expire_unloaded(session, instance):
+    """
+    Marks all columns of an *instance*, that were not loaded yet, as expired.
+    Unlike deferred columns, which are loaded one by one, all expired columns
+    are loaded in a single query on first access.
+    """
+    from sqlalchemy import inspect
+    state = inspect(instance)
+    unloaded = state.unloaded
+    keys = list(attr.key for attr in state.mapper.column_attrs
+                if attr.key in unloaded)
+    if keys:
+        session.expire(instance, keys)
+
+
+def _mk_eager_options(route, entities):
+    """
+    Converts the *eager* parameter of a route into a list of tuples
+    ``(name, option)``. Strings like ``"product.shop.owner"`` are converted
+    to a chain of joinedload options, starting at the entity of the callback
+    parameter ``product``, which is also the *name* of the returned tuple.
+    Any other value is expected to be a loader option already and will be
+    returned with the name `None`.
+    """
+    from sqlalchemy.orm import joinedload
+    from ._conf import InitializationError
+    name2entity = dict((name, entity) for name, _, entity, _ in entities)
+    options = []
+    for hint in route.eager:
+        if not isinstance(hint, str):
+            options.append((None, hint))
+            continue
+        name, *path = hint.split('.')
+        if name not in name2entity or not path:
+            raise InitializationError(
+                'Invalid eager loading hint "%s" in route "%s"' %
+                (hint, route.name))
+        current = name2entity[name]
+        option = None
+        for attr in path:
+            try:
+                attribute = getattr(current, attr)
+                current = attribute.property.mapper.class_
+            except AttributeError:
+                raise InitializationError(
+                    'Invalid eager loading hint "%s" in route "%s": '
+                    '"%s" is not a relationship' % (hint, route.name, attr))
+            if option is None:
+                option = joinedload(attribute)
+            else:
+                option = option.joinedload(attribute)
+        options.append((name, option))
+    return options
+
+
+class EntityCache:
+    """
+    A cache of ORM entities shared among all requests, which avoids querying
+    the same rows over and over again. The entities are stored as detached
+    snapshots of their loaded column values, keyed by the tuple ``(cls,
+    idcol, value)``. The cache holds at most *maxsize* entities, each for at
+    most *ttl* seconds.
+
+    Entities are evicted whenever the ORM updates or deletes them, provided
+    the cache was connected to the ORM's base class via :meth:`listen`.
+    Changes made by other processes will remain unnoticed until the *ttl*
+    expires, though.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self._cache = LRUCache(maxsize, ttl=ttl)
+        # maps identity keys of entities to the keys of the cache
+        self._identities = {}
+        self._lock = threading.Lock()
+
+    def listen(self, base):
+        """
+        Registers listeners on given declarative *base* class, which evict
+        all entities from the cache, that are updated or deleted.
+        """
+        from sqlalchemy import event
+        event.listen(base, 'after_update', self._evict_listener,
+                     propagate=True)
+        event.listen(base, 'after_delete', self._evict_listener,
+                     propagate=True)
+
+    def _evict_listener(self, mapper, connection, instance):
+        self.evict(instance)
+
+    def get(self, session, cls, idcol, value):
+        """
+        Provides the entity of *cls* with given *value* in column *idcol*,
+        merged into the given *session* without querying the database.
+        Returns `None` if the entity is not cached.
+        """
+        snapshot = self._cache.get((cls, idcol, value))
+        if snapshot is None:
+            return None
+        return session.merge(snapshot, load=False)
+
+    def put(self, cls, idcol, value, instance):
+        """
+        Stores a snapshot of given *instance* in the cache.
+        """
+        from sqlalchemy import inspect
+        from sqlalchemy.orm import make_transient_to_detached
+        from sqlalchemy.orm.attributes import set_committed_value
+        state = inspect(instance)
+        if state.identity_key is None or state.modified:
+            return
+        snapshot = state.mapper.class_manager.new_instance()
+        for attr in state.mapper.column_attrs:
+            if attr.key in state.dict:
+                set_committed_value(snapshot, attr.key, state.dict[attr.key])
+        make_transient_to_detached(snapshot)
+        key = (cls, idcol, value)
+        with self._lock:
+            self._cache.put(key, snapshot)
+            self._identities.setdefault(state.identity_key, set()).add(key)
+            if len(self._identities) > 2 * self._cache.maxsize:
+                self._cleanup()
+
+    def evict(self, instance):
+        """
+        Removes all snapshots of given *instance* from the cache.
+        """
+        from sqlalchemy import inspect
+        identity_key = inspect(instance).identity_key
+        with self._lock:
+            keys = self._identities.pop(identity_key, ())
+        for key in keys:
+            self._cache.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._identities.clear()
+
+    def _cleanup(self):
+        # removes references to keys, which were evicted by the LRUCache
+        for identity_key, keys in list(self._identities.items()):
+            keys.intersection_update(
+                key for key in keys if key in self._cache)
+            if not keys:
+                del self._identities[identity_key]
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def stats(self):
+        """
+        The counters of the underlying :class:`.LRUCache`.
+        """
+        return self._cache.stats
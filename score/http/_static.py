@@ -0,0 +1,716 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+# Copyright © 2019 Necdet Can Ateşman, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import binascii
+import mimetypes
+import os
+import re
+from stat import S_ISREG
+import functools
+import io
+import mmap
+import threading
+import time
+from ._cache import LRUCache
+from webob.datetime_utils import parse_date
+from webob.exc import HTTPNotFound
+
+
+#: The number of bytes to read at once, when serving files without the
+#: help of the WSGI server.
+BLOCK_SIZE = 256 * 1024
+
+
+#: The maximum number of ranges in a ``Range`` header. Requests with more
+#: ranges (after merging overlapping ones) receive the whole file.
+MAX_RANGES = 64
+
+
+class FileIter:
+    """
+    An iterator over the contents of a *file*, which is read in blocks of
+    *block_size* bytes. Used as the ``app_iter`` of a response, if the WSGI
+    server does not provide a ``wsgi.file_wrapper``, or if only a part of
+    the file is requested.
+
+    If a *start* offset is given, the iterator will seek to that position
+    first. The iterator will stop at the offset *stop*, if given.
+    """
+
+    def __init__(self, file, block_size=BLOCK_SIZE, start=None, stop=None):
+        self.file = file
+        self.block_size = block_size
+        self.start = start
+        self.stop = stop
+
+    def __iter__(self):
+        return self.iter_range(self.start, self.stop)
+
+    def iter_range(self, start, stop):
+        """
+        Generates the contents of the file between the offsets *start* and
+        *stop*, each of which may be `None`.
+        """
+        read = self.file.read
+        block_size = self.block_size
+        if start is not None:
+            self.file.seek(start)
+        if stop is None:
+            while True:
+                data = read(block_size)
+                if not data:
+                    break
+                yield data
+            return
+        remaining = stop - (start or 0)
+        while remaining > 0:
+            data = read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+class MmapFileIter:
+    """
+    An iterator over the contents of a memory-mapped file, which was acquired
+    from given :class:`MappedFiles` instance. The iterator yields slices of
+    *block_size* bytes between the offsets *start* and *stop*. These slices
+    are `memoryview` objects, if *memoryviews* is `True`, or `bytes`
+    otherwise.
+    """
+
+    def __init__(self, mapped_files, mapped, block_size=BLOCK_SIZE,
+                 start=None, stop=None, memoryviews=False):
+        self.mapped_files = mapped_files
+        self.mapped = mapped
+        self.block_size = block_size
+        self.start = start
+        self.stop = stop
+        self.memoryviews = memoryviews
+
+    def __iter__(self):
+        return self.iter_range(self.start, self.stop)
+
+    def iter_range(self, start, stop):
+        """
+        See :meth:`FileIter.iter_range`.
+        """
+        buffer = self.mapped.mmap
+        if self.memoryviews:
+            buffer = memoryview(buffer)
+        if start is None:
+            start = 0
+        if stop is None or stop > len(buffer):
+            stop = len(buffer)
+        block_size = self.block_size
+        for offset in range(start, stop, block_size):
+            yield buffer[offset:min(offset + block_size, stop)]
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped_files.release(self.mapped)
+            self.mapped = None
+
+
+class MultipartFileIter:
+    """
+    An iterator creating a ``multipart/byteranges`` body out of the given
+    *ranges* of a file. The file contents are retrieved from the *source*,
+    which must be a :class:`FileIter` or a :class:`MmapFileIter`. The
+    *ranges* must be a list of tuples ``(start, stop)``. The total number of
+    bytes generated by this iterator is available as :attr:`length`.
+    """
+
+    def __init__(self, source, ranges, boundary, content_type, size):
+        self.source = source
+        self.parts = []
+        for start, stop in ranges:
+            header = ('--%s\r\nContent-Type: %s\r\n'
+                      'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                          boundary, content_type, start, stop - 1, size))
+            self.parts.append((header.encode('ascii'), start, stop))
+        self.trailer = ('--%s--\r\n' % boundary).encode('ascii')
+        self.length = len(self.trailer) + sum(
+            len(header) + stop - start + 2
+            for header, start, stop in self.parts)
+
+    def __iter__(self):
+        for header, start, stop in self.parts:
+            yield header
+            yield from self.source.iter_range(start, stop)
+            yield b'\r\n'
+        yield self.trailer
+
+    def close(self):
+        self.source.close()
+
+
+class MappedFile:
+    """
+    A memory-mapped file shared by all :class:`MmapFileIter` objects
+    delivering it.
+    """
+
+    __slots__ = ('key', 'mmap', 'refcount')
+
+    def __init__(self, key, mmap):
+        self.key = key
+        self.mmap = mmap
+        self.refcount = 0
+
+
+class MappedFiles:
+    """
+    Delivers files of at least *threshold* bytes from memory-mapped buffers,
+    which avoids the overhead of reading them through Python. Requests for
+    the same file share the same mapping, which is closed as soon as the
+    last of these requests is finished.
+
+    The iterators yield `memoryview` objects, if *memoryviews* is `True`.
+    This avoids copying the data altogether, but requires a WSGI server
+    accepting any bytes-like object. Note that :pep:`3333` demands `bytes`
+    and some servers enforce that (werkzeug, for example).
+
+    Files must not be truncated while they are mapped, since accessing the
+    missing pages will crash the process. Deploy new versions of files by
+    replacing them (e.g. via :func:`os.replace`) instead.
+    """
+
+    def __init__(self, threshold=1024 * 1024, memoryviews=False):
+        self.threshold = threshold
+        self.memoryviews = memoryviews
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def accepts(self, size):
+        """
+        Whether a file with given *size* should be memory-mapped.
+        """
+        return size >= self.threshold and size > 0
+
+    def iter(self, path, file, stat, start=None, stop=None):
+        """
+        Creates a :class:`MmapFileIter` for the opened *file* with given
+        *path* and *stat* result. The file will be closed, as the mapping
+        does not need it.
+        """
+        key = (path, _stat_key(stat))
+        with self._lock:
+            mapped = self._files.get(key)
+            if mapped is None:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                mapped = self._files[key] = MappedFile(key, buffer)
+            mapped.refcount += 1
+        file.close()
+        return MmapFileIter(self, mapped, start=start, stop=stop,
+                            memoryviews=self.memoryviews)
+
+    def release(self, mapped):
+        """
+        Releases a :class:`MappedFile` acquired via :meth:`iter`.
+        """
+        with self._lock:
+            mapped.refcount -= 1
+            if mapped.refcount:
+                return
+            if self._files.get(mapped.key) is mapped:
+                del self._files[mapped.key]
+        try:
+            mapped.mmap.close()
+        except BufferError:
+            # some memoryview objects are still alive, the mapping will be
+            # closed once they are garbage collected
+            pass
+
+    def __len__(self):
+        return len(self._files)
+
+
+def resolve_path(base, path):
+    """
+    Joins the *base* folder and the requested *path*. Raises
+    :class:`webob.exc.HTTPNotFound` if the resulting path is outside of
+    *base*.
+    """
+    base = os.path.abspath(base)
+    result = os.path.normpath(os.path.join(base, path))
+    if not result.startswith(os.path.join(base, '')):
+        raise HTTPNotFound()
+    return result
+
+
+@functools.lru_cache(maxsize=1024)
+def guess_mimetype(path, mimetype=(None, None)):
+    """
+    Provides the content type and the content encoding of the file at given
+    *path* as a tuple. A content type in the tuple *mimetype* takes
+    precedence over the guessed values.
+    """
+    if mimetype[0]:
+        return mimetype
+    guess = mimetypes.guess_type(path, strict=False)
+    if guess[0]:
+        return guess
+    return mimetype
+
+
+def etag(stat):
+    """
+    Creates an entity tag for a file from the result of its :func:`os.stat`.
+    """
+    return '%x-%x-%x' % _stat_key(stat)
+
+
+def is_not_modified(request, stat):
+    """
+    Tests whether the client issuing the *request* already has the current
+    version of the file with given *stat* result. The ``If-Modified-Since``
+    header is ignored if the request contains an ``If-None-Match`` header.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if 'If-None-Match' in request.headers:
+        return etag(stat) in request.if_none_match
+    since = request.if_modified_since
+    if since is None:
+        return False
+    return int(stat.st_mtime) <= since.timestamp()
+
+
+def if_range_matches(request, stat):
+    """
+    Tests whether the ``If-Range`` header of the *request* (if there is one)
+    matches the file with given *stat* result, i.e. whether the ``Range``
+    header of the request should be honored.
+    """
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith('"'):
+        return value == '"%s"' % etag(stat)
+    if value.startswith('W/'):
+        # weak entity tags must not be used for range requests
+        return False
+    date = parse_date(value)
+    return date is not None and date.timestamp() == int(stat.st_mtime)
+
+
+# str.isdigit() would also accept characters like '²', which int() rejects
+_digits = re.compile(r'[0-9]+\Z')
+
+
+def parse_ranges(header, size):
+    """
+    Parses the value of a ``Range`` *header* for a file with given *size*.
+    Returns a sorted list of tuples ``(start, stop)`` with overlapping ranges
+    merged. The list is empty if none of the ranges is satisfiable. Returns
+    `None`, if the header is invalid and should thus be ignored.
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    found = False
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        found = True
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first or last) or \
+                (first and not _digits.match(first)) or \
+                (last and not _digits.match(last)):
+            return None
+        if not first:
+            # suffix range: the last N bytes of the file
+            if not int(last):
+                continue
+            ranges.append((max(0, size - int(last)), size))
+            continue
+        start = int(first)
+        stop = size
+        if last:
+            stop = int(last) + 1
+            if stop <= start:
+                return None
+        if start >= size:
+            continue
+        ranges.append((start, min(stop, size)))
+    if not found:
+        return None
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def set_validators(response, stat, cache_control=None):
+    """
+    Sets the headers of the *response*, that allow clients to cache the file
+    with given *stat* result.
+    """
+    response.etag = etag(stat)
+    response.last_modified = int(stat.st_mtime)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+
+
+def parse_accept_encoding(header):
+    """
+    Parses the value of an ``Accept-Encoding`` *header* into a `dict` mapping
+    content codings to their quality values.
+    """
+    result = {}
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        result[coding] = quality
+    return result
+
+
+class PrecompressedFiles:
+    """
+    Selects precompressed variants of static files, i.e. files with the
+    same name and an additional suffix like ``.gz``. The *encodings* are the
+    supported content codings in the order of preference. The information,
+    which variants of a file exist, is kept in an :class:`.LRUCache` of
+    *cache_size* entries for *ttl* seconds.
+    """
+
+    #: The suffixes of the files for each content coding.
+    suffixes = {
+        'br': '.br',
+        'gzip': '.gz',
+    }
+
+    def __init__(self, encodings=('br', 'gzip'), cache_size=1000, ttl=60):
+        for encoding in encodings:
+            if encoding not in self.suffixes:
+                raise ValueError('Unsupported encoding "%s"' % encoding)
+        self.encodings = tuple(encodings)
+        self._cache = LRUCache(cache_size, ttl=ttl)
+
+    def variants(self, path):
+        """
+        Provides a list of tuples ``(encoding, path)`` of all existing
+        precompressed variants of the file at *path*.
+        """
+        variants = self._cache.get(path)
+        if variants is None:
+            variants = []
+            for encoding in self.encodings:
+                variant = path + self.suffixes[encoding]
+                if os.path.isfile(variant):
+                    variants.append((encoding, variant))
+            variants = tuple(variants)
+            self._cache.put(path, variants)
+        return variants
+
+    def invalidate(self, path):
+        """
+        Removes the cached information about the variants of *path*.
+        """
+        self._cache.pop(path)
+
+    def select(self, request, path):
+        """
+        Determines the best variant of the file at *path* for given
+        *request*. Returns the tuple ``(encoding, path)``, where *encoding*
+        is `None`, if the original file should be delivered.
+        """
+        header = request.headers.get('Accept-Encoding')
+        if not header:
+            return None, path
+        variants = self.variants(path)
+        if not variants:
+            return None, path
+        accepted = parse_accept_encoding(header)
+        default = accepted.get('*', 0.0)
+        best = (None, path)
+        best_quality = accepted.get('identity', max(default, 0.001))
+        for encoding, variant in variants:
+            quality = accepted.get(encoding, default)
+            if quality > 0 and quality >= best_quality and \
+                    (best[0] is None or quality > best_quality):
+                best = (encoding, variant)
+                best_quality = quality
+        return best
+
+
+class CachedFile:
+    """
+    The contents (*data*) and the :func:`os.stat` result (*stat*) of a file
+    in a :class:`StaticFileCache`.
+    """
+
+    __slots__ = ('data', 'stat', 'checked')
+
+    def __init__(self, data, stat):
+        self.data = data
+        self.stat = stat
+        self.checked = time.monotonic()
+
+
+class StaticFileCache:
+    """
+    Keeps the contents of small static files in memory. The cache holds at
+    most *max_bytes* bytes of file contents, files larger than
+    *max_file_size* bytes are never cached. The least recently used files
+    are discarded first.
+
+    A cached file is tested for modifications by comparing its current
+    :func:`os.stat` result with the cached one, if the last test is at least
+    *revalidate* seconds ago. The default value of ``0`` performs this test
+    on every request, which is still much cheaper than reading the file.
+    Passing `None` disables the test completely, which is only advisable for
+    files that never change.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024,
+                 revalidate=0):
+        if max_file_size > max_bytes:
+            raise ValueError('Maximum file size exceeds the cache size')
+        self.max_file_size = max_file_size
+        self.revalidate = revalidate
+        self._cache = LRUCache(max_bytes, sizeof=lambda file: len(file.data))
+
+    def accepts(self, size):
+        """
+        Whether a file with given *size* may be cached.
+        """
+        return size <= self.max_file_size
+
+    def get(self, path):
+        """
+        Provides the :class:`CachedFile` for given *path*, or `None`, if the
+        file is not cached or was modified.
+        """
+        cached = self._cache.get(path)
+        if cached is None or self.revalidate is None:
+            return cached
+        now = time.monotonic()
+        if now - cached.checked < self.revalidate:
+            return cached
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or _stat_key(stat) != _stat_key(cached.stat):
+            self._cache.pop(path)
+            return None
+        cached.checked = now
+        return cached
+
+    def put(self, path, data, stat):
+        """
+        Stores the contents of a file and returns the :class:`CachedFile`.
+        """
+        cached = CachedFile(data, stat)
+        self._cache.put(path, cached)
+        return cached
+
+    def invalidate(self, path=None):
+        """
+        Removes the file with given *path* from the cache, or all files, if
+        no *path* is given.
+        """
+        if path is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(path)
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def stats(self):
+        """
+        The counters of the underlying :class:`.LRUCache`.
+        """
+        return self._cache.stats
+
+
+def _stat_key(stat):
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def serve_file(ctx, path, mimetype=(None, None), cache_control=None,
+               precompressed=None, file_cache=None, mapped_files=None):
+    """
+    Sets up the response of given context to deliver the file at *path*. The
+    file is handed to the ``wsgi.file_wrapper`` of the server, if there is
+    one. This allows servers to send the file using efficient operating
+    system functions like ``sendfile()``. Otherwise, the file is read in
+    large blocks (see :class:`FileIter`).
+
+    The response will contain an ``ETag`` and a ``Last-Modified`` header, as
+    well as the given *cache_control* header. If the client already has the
+    current version of the file, the response will be a ``304 Not
+    Modified`` and the file will not be opened at all.
+
+    ``Range`` requests are answered with a ``206 Partial Content`` response
+    containing just the requested bytes of the file. Multiple ranges are
+    delivered as ``multipart/byteranges``.
+
+    If a :class:`PrecompressedFiles` instance is passed as *precompressed*,
+    the best precompressed variant of the file acceptable to the client is
+    delivered instead.
+
+    Small files can be kept in memory by passing a :class:`StaticFileCache`
+    as *file_cache*, large files can be memory-mapped by passing a
+    :class:`MappedFiles` instance as *mapped_files*.
+    """
+    request = ctx.http.request
+    response = ctx.http.response
+    content_type, content_encoding = guess_mimetype(path, mimetype)
+    filepath = path
+    if precompressed is not None:
+        response.vary = ('Accept-Encoding',)
+        encoding, filepath = precompressed.select(request, path)
+        if encoding:
+            content_encoding = encoding
+    cached = None
+    if file_cache is not None:
+        cached = file_cache.get(filepath)
+    if cached is not None:
+        stat = cached.stat
+    else:
+        try:
+            stat = os.stat(filepath)
+        except (FileNotFoundError, NotADirectoryError):
+            if filepath != path:
+                # the variant was removed in the meantime
+                precompressed.invalidate(path)
+                return serve_file(ctx, path, mimetype, cache_control,
+                                  file_cache=file_cache,
+                                  mapped_files=mapped_files)
+            raise HTTPNotFound()
+        if not S_ISREG(stat.st_mode):
+            raise HTTPNotFound()
+    if is_not_modified(request, stat):
+        response.status = 304
+        response.app_iter = []
+        response.content_length = None
+        del response.content_type
+        set_validators(response, stat, cache_control)
+        return
+    if cached is not None:
+        file = io.BytesIO(cached.data)
+    else:
+        try:
+            file = open(filepath, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise HTTPNotFound()
+        try:
+            # the file might have changed since the call to os.stat() above
+            stat = os.fstat(file.fileno())
+            if file_cache is not None and file_cache.accepts(stat.st_size):
+                data = file.read()
+                file.close()
+                cached = file_cache.put(filepath, data, stat)
+                file = io.BytesIO(data)
+        except Exception:
+            file.close()
+            raise
+
+    def source(start=None, stop=None):
+        if cached is None and mapped_files is not None and \
+                mapped_files.accepts(stat.st_size):
+            try:
+                return mapped_files.iter(filepath, file, stat, start, stop)
+            except (OSError, ValueError):
+                # not all files can be memory-mapped
+                pass
+        return FileIter(file, start=start, stop=stop)
+
+    ranges = None
+    if request.method == 'GET' and 'Range' in request.headers and \
+            if_range_matches(request, stat):
+        ranges = parse_ranges(request.headers['Range'], stat.st_size)
+    if ranges is None:
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if cached is not None:
+            response.app_iter = [cached.data]
+        elif file_wrapper:
+            response.app_iter = file_wrapper(file, BLOCK_SIZE)
+        else:
+            response.app_iter = source()
+        response.content_length = stat.st_size
+    elif not ranges:
+        file.close()
+        response.status = 416
+        response.app_iter = []
+        response.content_length = None
+        response.headers['Content-Range'] = 'bytes */%d' % stat.st_size
+    elif len(ranges) == 1:
+        # the wsgi.file_wrapper cannot be used here, as servers are not
+        # required to stop at the Content-Length
+        start, stop = ranges[0]
+        response.status = 206
+        response.app_iter = source(start, stop)
+        response.content_length = stop - start
+        response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+            start, stop - 1, stat.st_size)
+    else:
+        boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+        app_iter = MultipartFileIter(
+            source(), ranges, boundary,
+            content_type or 'application/octet-stream', stat.st_size)
+        response.status = 206
+        response.app_iter = app_iter
+        response.content_length = app_iter.length
+    set_validators(response, stat, cache_control)
+    response.accept_ranges = 'bytes'
+    if ranges and len(ranges) > 1:
+        response.headers['Content-Type'] = \
+            'multipart/byteranges; boundary=%s' % boundary
+    else:
+        response.content_type = content_type
+        if content_encoding:
+            response.content_encoding = content_encoding
@@ -30,6 +30,11 @@ import re
 import urllib
 
 
+# a value greater than any code point: used in sort keys to make a string
+# sort before all strings, that it is a prefix of.
+_END_OF_STRING = 0x110000
+
+
 class UrlGenerationException(Exception):
     pass
 
@@ -44,15 +49,65 @@ class InvalidVariable(UrlGenerationException, ValueError):
 
 class UrlTemplate(abc.ABC):
 
+    _regex = None
+
+    #: The pattern of host names this template is restricted to, or `None`,
+    #: if it applies to all hosts.
+    host = None
+
+    #: The compiled regular expression of the :attr:`host` pattern.
+    host_regex = None
+
+    #: The number of times this template's regular expression was compiled.
+    #: Should never be greater than one.
+    compile_count = 0
+
+    def compile(self):
+        """
+        Compiles the regular expression of this template, unless this was
+        already done. The module will compile all templates during its
+        finalization, so the :attr:`regex` is readily available when handling
+        requests.
+        """
+        if self._regex is None:
+            self._regex = self._to_regex()
+            self.compile_count += 1
+        return self._regex
+
     @property
     def regex(self):
-        if not hasattr(self, '__regex'):
-            self.__regex = self._to_regex()
-        return self.__regex
+        """
+        The compiled regular expression of this template.
+        """
+        if self._regex is None:
+            return self.compile()
+        return self._regex
 
     def match2vars(self, ctx, match):
         return dict((var, match.group(var)) for var in self.variables)
 
+    @property
+    def literal_prefix(self):
+        """
+        The leading part of every URL matching this template, that contains
+        no variables. Used by the dispatcher to narrow down the routes, that
+        need to be tested for a given URL. The default implementation makes no
+        assumptions and returns an empty string.
+        """
+        return ''
+
+    @property
+    def sort_key(self):
+        """
+        A key for :func:`sorted`, that orders templates exactly like the
+        less-than operator of this class. Sorting a list of templates with
+        this key is much faster than a pairwise comparison of all templates.
+
+        The default implementation just wraps the template, subclasses
+        should provide a cheaper key.
+        """
+        return _LessThanKey(self)
+
     @property
     @abc.abstractmethod
     def variables(self):
@@ -76,6 +131,10 @@ class StaticUrl(UrlTemplate):
     def __init__(self, string):
         self.string = string
 
+    @property
+    def literal_prefix(self):
+        return self.string
+
     @property
     def variables(self):
         return []
@@ -83,6 +142,15 @@ class StaticUrl(UrlTemplate):
     def _to_regex(self):
         return re.compile(re.escape(self.string))
 
+    def __repr__(self):
+        return 'StaticUrl(%s)' % self.string
+
+    @property
+    def sort_key(self):
+        # static urls always sort before pattern urls, see
+        # PatternUrlTemplate.sort_key
+        return (0, self.string)
+
     def __lt__(self, other):
         if isinstance(other, PatternUrlTemplate):
             return True
@@ -113,17 +181,38 @@ class PatternUrlPart:
 
 class PatternUrlTemplate(UrlTemplate):
 
-    def __init__(self, pattern):
+    def __init__(self, pattern, host=None):
         super().__init__()
         if not pattern:
             pattern = '/'
         elif pattern[0] != '/':
             pattern = '/' + pattern
         self.pattern = pattern
-        self.parts = []
-        self._regex_pattern = ''
         self._var2regex = {}
         self._regexname2var = {}
+        self._host_var2regex = {}
+        self._host_regexname2var = {}
+        self.parts, self._regex_pattern = self._parse(
+            pattern, '[^/]+', self._var2regex, self._regexname2var)
+        self._regex_pattern += '$'
+        self.host = host
+        self.host_parts = []
+        if host is not None:
+            # the host of a request is always matched in lower case
+            self.host_parts, self._host_regex_pattern = self._parse(
+                host, '[^.]+', self._host_var2regex,
+                self._host_regexname2var, lowercase=True)
+            self._host_regex_pattern += '$'
+        self._generator = _mkgenerator(
+            self.parts, self._var2regex, urllib.parse.quote)
+        self._host_generator = _mkgenerator(
+            self.host_parts, self._host_var2regex, str)
+
+    def _parse(self, pattern, default_regex, var2regex, regexname2var,
+               lowercase=False):
+        original = pattern
+        parts = []
+        regex_pattern = ''
         while pattern:
             if pattern[0] != '{':
                 if '{' in pattern:
@@ -131,18 +220,20 @@ class PatternUrlTemplate(UrlTemplate):
                 else:
                     part = pattern
                 pattern = pattern[len(part):]
-                self.parts.append(PatternUrlPart(0, part))
-                self._regex_pattern += re.escape(part)
+                if lowercase:
+                    part = part.lower()
+                parts.append(PatternUrlPart(0, part))
+                regex_pattern += re.escape(part)
                 continue
             if '}' not in pattern:
-                raise Exception('Invalid pattern: ' + self.pattern)
+                raise Exception('Invalid pattern: ' + original)
             brace_idx = pattern.index('}')
             chevron_idx = brace_idx + 1
             if '>' in pattern:
                 chevron_idx = pattern.index('>')
             if brace_idx < chevron_idx:
                 name = pattern[1:brace_idx]
-                regex = '[^/]+'
+                regex = default_regex
                 pattern = pattern[brace_idx + 1:]
             else:
                 name = pattern[1:chevron_idx]
@@ -155,55 +246,95 @@ class PatternUrlTemplate(UrlTemplate):
                     elif pattern[idx] == '{':
                         open_braces += 1
                 else:
-                    raise Exception('Invalid pattern: ' + self.pattern)
+                    raise Exception('Invalid pattern: ' + original)
                 regex = pattern[chevron_idx + 1:idx]
                 pattern = pattern[idx + 1:]
-            self._var2regex[name] = re.compile(regex)
-            self.parts.append(PatternUrlPart(10, regex, name))
-            re_name = self._mkregexname(name)
-            self._regex_pattern += '(?P<%s>%s)' % (re_name, regex)
-        self._regex_pattern += '$'
+            var2regex[name] = re.compile(regex)
+            parts.append(PatternUrlPart(10, regex, name))
+            re_name = self._mkregexname(name, regexname2var)
+            regex_pattern += '(?P<%s>%s)' % (re_name, regex)
+        return parts, regex_pattern
 
     def match2vars(self, ctx, match):
         return dict((var, match.group(name))
                     for name, var in self._regexname2var.items())
 
-    def _mkregexname(self, name):
+    def host_match2vars(self, match):
+        """
+        Like :meth:`match2vars`, but for a match of the :attr:`host_regex`.
+        """
+        return dict((var, match.group(name))
+                    for name, var in self._host_regexname2var.items())
+
+    def _mkregexname(self, name, regexname2var):
         re_name = re.sub(r'[^a-z0-9_]', '_', name)
-        if re_name in self._regexname2var:
+        if re_name in self._regexname2var or \
+                re_name in self._host_regexname2var:
             i = 1
             new_name = re_name + '_1'
-            while new_name in self._regexname2var:
+            while new_name in self._regexname2var or \
+                    new_name in self._host_regexname2var:
                 i += 1
-                new_name = re_name + '_' + i
+                new_name = re_name + '_' + str(i)
             re_name = new_name
-        self._regexname2var[re_name] = name
+        regexname2var[re_name] = name
         return re_name
 
     @property
-    def variables(self):
-        return list(self._var2regex.keys())
+    def literal_prefix(self):
+        if self.parts[0].is_regex:
+            return ''
+        return self.parts[0].pattern
 
-    def generate(self, **kwargs):
-        for var, regex in self._var2regex.items():
-            if var not in kwargs:
-                raise MissingVariable(var)
-            kwargs[var] = str(kwargs[var])
-            if not regex.match(kwargs[var]):
-                raise InvalidVariable(
-                    'Value for "%s" does not match variable\'s regex (%s)' %
-                    (var, regex.pattern))
-        url = ''
-        for part in self.parts:
-            if part.variable:
-                url += urllib.parse.quote(kwargs[part.variable])
-            else:
-                url += part.pattern
-        return url
+    @property
+    def variables(self):
+        variables = list(self._var2regex.keys())
+        for var in self._host_var2regex:
+            if var not in self._var2regex:
+                variables.append(var)
+        return variables
+
+    def compile(self):
+        if self.host is not None and self.host_regex is None:
+            self.host_regex = re.compile(self._host_regex_pattern)
+        return super().compile()
+
+    def generate_host(self, _validate=True, **kwargs):
+        """
+        Generates the host name for given variables. See :meth:`generate` for
+        the description of *_validate*.
+        """
+        return self._host_generator(kwargs, _validate)
+
+    def generate(self, _validate=True, **kwargs):
+        """
+        Generates the URL for given variables. All values are converted to
+        `str` and checked against the regular expression of their variable,
+        unless *_validate* is `False`. The latter is useful for callers, which
+        can guarantee valid values and generate a lot of URLs.
+        """
+        return self._generator(kwargs, _validate)
 
     def _to_regex(self):
         return re.compile(self._regex_pattern)
 
+    @property
+    def sort_key(self):
+        if not hasattr(self, '_sort_key'):
+            self._sort_key = (1, _parts_sort_key(self.parts),
+                              self._host_sort_key)
+        return self._sort_key
+
+    @property
+    def _host_sort_key(self):
+        # templates with a host sort before templates without one, literal
+        # hosts before host patterns.
+        if self.host is None:
+            return (2,)
+        if any(part.is_regex for part in self.host_parts):
+            return (1, _parts_sort_key(self.host_parts))
+        return (0, _parts_sort_key(self.host_parts))
+
     def __str__(self):
         result = ''
         for part in self.parts:
@@ -214,6 +345,9 @@ class PatternUrlTemplate(UrlTemplate):
         return result
 
     def __repr__(self):
+        if self.host is not None:
+            return 'PatternUrlTemplate(%s, host=%s)' % (
+                self.pattern, self.host)
         return 'PatternUrlTemplate(%s)' % self.pattern
 
     def __lt__(self, other):
@@ -234,24 +368,105 @@ class PatternUrlTemplate(UrlTemplate):
                 return True
             if mypart.is_regex and not hispart.is_regex:
                 return False
-        return len(self.parts) > len(other.parts)
+        if len(self.parts) != len(other.parts):
+            return len(self.parts) > len(other.parts)
+        return self._host_sort_key < other._host_sort_key
 
     def equals(self, other):
         if self is other:
             return True
         if not isinstance(other, UrlTemplate):
             return False
+        if self.host != other.host:
+            if not isinstance(other, PatternUrlTemplate):
+                return False
+            if not _equal_parts(self.host_parts, other.host_parts):
+                return False
         if self.regex.pattern == other.regex.pattern:
             return True
         if not isinstance(other, PatternUrlTemplate):
             return False
-        if len(self.parts) != len(other.parts):
+        return _equal_parts(self.parts, other.parts)
+
+
+def _mkgenerator(parts, var2regex, quote):
+    """
+    Creates a function generating a string out of given template *parts*. The
+    function accepts a `dict` of variable values and a flag whether the
+    values should be validated against their regular expressions in
+    *var2regex*. The variable values are passed through *quote* before they
+    are inserted into the string.
+    """
+    if not var2regex:
+        string = ''.join(part.pattern for part in parts)
+
+        def generate(kwargs, validate):
+            return string
+        return generate
+    chunks = []
+    slots = []
+    for part in parts:
+        if part.variable:
+            slots.append((len(chunks), part.variable))
+            chunks.append(None)
+        else:
+            chunks.append(part.pattern)
+    checks = list((var, regex.match, regex.pattern)
+                  for var, regex in var2regex.items())
+
+    def generate(kwargs, validate):
+        values = {}
+        for var, match, pattern in checks:
+            try:
+                value = str(kwargs[var])
+            except KeyError:
+                raise MissingVariable(var)
+            if validate and not match(value):
+                raise InvalidVariable(
+                    'Value for "%s" does not match variable\'s regex (%s)' %
+                    (var, pattern))
+            values[var] = value
+        result = chunks[:]
+        for idx, var in slots:
+            result[idx] = quote(values[var])
+        return ''.join(result)
+    return generate
+
+
+def _parts_sort_key(parts):
+    key = []
+    for part in parts:
+        if part.is_regex:
+            key.append((1,))
+        else:
+            key.append((0, tuple(map(ord, part.pattern)) + (_END_OF_STRING,)))
+    # templates with more parts sort before their prefixes
+    key.append((2,))
+    return tuple(key)
+
+
+def _equal_parts(parts, other_parts):
+    if len(parts) != len(other_parts):
+        return False
+    for part, other_part in zip(parts, other_parts):
+        if part.is_regex != other_part.is_regex:
             return False
-        for i in range(len(self.parts)):
-            mypart = self.parts[i]
-            otherpart = other.parts[i]
-            if mypart.is_regex != otherpart.is_regex:
-                return False
-            if mypart.pattern != otherpart.pattern:
-                return False
-        return True
+        if part.pattern != other_part.pattern:
+            return False
+    return True
+
+
+class _LessThanKey:
+
+    __slots__ = ('urltpl',)
+
+    def __init__(self, urltpl):
+        self.urltpl = urltpl
+
+    def __lt__(self, other):
+        return self.urltpl < other.urltpl
+
+    def __eq__(self, other):
+        return not (self.urltpl < other.urltpl or other.urltpl < self.urltpl)
+
+    __hash__ = None
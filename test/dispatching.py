@@ -0,0 +1,326 @@
+from score.ctx import init as init_score_ctx
+from score.http import init, RouterConfiguration as Router
+from score.http._dispatch import RoutingState
+from webob import Request
+from unittest.mock import Mock, patch
+import urllib
+
+
+def init_ctx():
+    ctx = init_score_ctx()
+    ctx._finalize(object())
+    return ctx
+
+
+def mkconf(router):
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    return conf
+
+
+def candidates(conf, path):
+    routing = RoutingState(path)
+    return list(route.name for route in conf.dispatcher.candidates(routing))
+
+
+def test_candidates_exclude_other_prefixes():
+    router = Router()
+    router.route('home', '/')(lambda ctx: 'home')
+    router.route('user', '/user/{name}')(lambda ctx, name: name)
+    router.route('article', '/article/{id>\\d+}')(lambda ctx, id: id)
+    router.route('catchall', '/{path>.*}')(lambda ctx, path: path)
+    conf = mkconf(router)
+    assert 'article' not in candidates(conf, '/user/lancelot')
+    assert 'user' not in candidates(conf, '/article/1')
+    assert 'user' not in candidates(conf, '/')
+    assert 'article' not in candidates(conf, '/')
+    assert candidates(conf, '/user/lancelot')[0] == 'user'
+    assert candidates(conf, '/article/1')[0] == 'article'
+
+
+def test_candidates_keep_sort_order():
+    router = Router()
+    for i in range(50):
+        router.route('a%d' % i, '/a/%d/{var}' % i)(lambda ctx, var: var)
+        router.route('b%d' % i, '/a/{var}/%d' % i)(lambda ctx, var: var)
+    router.route('a', '/a/{var}')(lambda ctx, var: var)
+    router.route('root', '/{var>.*}')(lambda ctx, var: var)
+    conf = mkconf(router)
+    for path in ('/a/1/x', '/a/x/1', '/a/x', '/b'):
+        expected = list(name for name, route in conf.routes.items()
+                        if route.urltpl.regex.match(path))
+        routing = RoutingState(path)
+        found = list(route.name
+                     for route in conf.dispatcher.candidates(routing)
+                     if route.urltpl.regex.match(path))
+        assert found == expected
+
+
+def test_fall_through_on_failed_precondition():
+    router = Router()
+
+    @router.route('special', '/article/special')
+    def special(ctx):
+        return 'special'
+
+    @special.precondition
+    def never(ctx):
+        return False
+
+    router.route('article', '/article/{slug}')(
+        lambda ctx, slug: 'article ' + slug)
+    router.route('other', '/{path>.*}')(lambda ctx, path: 'other')
+    conf = mkconf(router)
+    response = conf.create_response(Request.blank('/article/special'))
+    assert response.text == 'article special'
+    assert conf.find_route_for('/article/special').name == 'article'
+
+
+def test_fall_through_on_failed_match2vars():
+    router = Router()
+
+    @router.route('number', '/{value}')
+    def number(ctx, value):
+        return 'number %d' % value
+
+    @number.match2vars
+    def number_match2vars(ctx, matches):
+        try:
+            return {'value': int(matches['value'])}
+        except ValueError:
+            return None
+
+    router.route('word', '/{value>.*}', after='number')(
+        lambda ctx, value: 'word ' + value)
+    conf = mkconf(router)
+    assert conf.create_response(Request.blank('/42')).text == 'number 42'
+    assert conf.create_response(Request.blank('/foo')).text == 'word foo'
+    assert conf.create_response(Request.blank('/foo/bar')).text == \
+        'word foo/bar'
+
+
+def test_not_found():
+    router = Router()
+    router.route('user', '/user/{name}')(lambda ctx, name: name)
+    conf = mkconf(router)
+    assert conf.create_response(Request.blank('/article/1')).status_int == 404
+    assert conf.find_route_for('/article/1') is None
+
+
+def test_literal_routes_are_looked_up_directly():
+    router = Router()
+    router.route('login', '/login')(lambda ctx: 'login')
+    router.route('health', '/api/health')(lambda ctx: 'health')
+    router.route('slug', '/{slug}')(lambda ctx, slug: 'slug ' + slug)
+    conf = mkconf(router)
+    assert conf.dispatcher.candidates(RoutingState('/login')) == (
+        conf.route('login'), conf.route('slug'))
+    assert conf.dispatcher.candidates(RoutingState('/api/health')) == (
+        conf.route('health'),)
+    assert conf.create_response(Request.blank('/login')).text == 'login'
+    assert conf.create_response(Request.blank('/api/health')).text == \
+        'health'
+    assert conf.create_response(Request.blank('/logout')).text == \
+        'slug logout'
+
+
+def test_literal_routes_respect_priority():
+    router = Router()
+    router.route('login', '/login')(lambda ctx: 'login')
+    router.route('auth', '/{action>login|logout}', before='login')(
+        lambda ctx, action: 'auth ' + action)
+    conf = mkconf(router)
+    assert list(conf.routes) == ['auth', 'login']
+    assert conf.dispatcher.candidates(RoutingState('/login')) == (
+        conf.route('auth'), conf.route('login'))
+    assert conf.create_response(Request.blank('/login')).text == 'auth login'
+
+
+def test_path_is_decoded_once():
+    router = Router()
+    for i in range(20):
+        router.route('route%d' % i, '/{a}/%d' % i)(lambda ctx, a: a)
+    router.route('last', '/{a}/{b}')(lambda ctx, a, b: a + b)
+    conf = mkconf(router)
+    unquote = urllib.parse.unquote
+    with patch('urllib.parse.unquote', wraps=unquote) as mock:
+        response = conf.create_response(Request.blank('/f%20o/b%20r'))
+    assert response.text == 'f ob r'
+    assert mock.call_count == 1
+    assert RoutingState('/foo/bar').segments == ['', 'foo', 'bar']
+
+
+def test_routing_cache():
+    router = Router()
+    calls = []
+
+    @router.route('article', '/article/{slug}')
+    def article(ctx, slug):
+        return 'article ' + slug
+
+    @article.precondition
+    def not_secret(ctx, slug):
+        calls.append(slug)
+        return slug != 'secret'
+
+    router.route('other', '/{path>.*}')(lambda ctx, path: 'other ' + path)
+    conf = init({
+        'router': router,
+        'routing.cache': 'true',
+        'routing.cache.size': '2',
+    }, ctx=init_ctx())
+    conf._finalize()
+    cache = conf.routing_cache
+    for _ in range(3):
+        response = conf.create_response(Request.blank('/article/foo'))
+        assert response.text == 'article foo'
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert calls == ['foo', 'foo', 'foo']
+    for _ in range(2):
+        response = conf.create_response(Request.blank('/article/secret'))
+        assert response.text == 'other article/secret'
+    assert (cache.hits, cache.misses) == (3, 2)
+    assert cache.evictions == 0
+    conf.create_response(Request.blank('/bar'))
+    assert cache.evictions == 1
+    assert len(cache) == 2
+
+
+def test_routing_cache_disabled_by_default():
+    router = Router()
+    conf = mkconf(router)
+    assert conf.routing_cache is None
+
+
+def test_templates_are_compiled_once():
+    router = Router()
+    router.route('home', '/')(lambda ctx: 'home')
+    for i in range(10):
+        router.route('route%d' % i, '/%d/{a}' % i)(lambda ctx, a: a)
+    router.route('last', '/{a}/{b}')(lambda ctx, a, b: a + b)
+    conf = mkconf(router)
+    for route in conf.routes.values():
+        assert route.urltpl.compile_count == 1
+    for _ in range(3):
+        for path in ('/', '/1/a', '/x/y', '/x/y/z'):
+            conf.create_response(Request.blank(path))
+            conf.find_route_for(path)
+    for route in conf.routes.values():
+        assert route.urltpl.compile_count == 1
+
+
+def test_methods():
+    router = Router()
+    router.route('show', '/article/{id}', methods='GET')(
+        lambda ctx, id: 'show ' + id)
+    router.route('update', '/article/{id}', methods=['post', 'PUT'])(
+        lambda ctx, id: 'update ' + id)
+    router.route('any', '/any')(lambda ctx: ctx.http.request.method)
+    conf = mkconf(router)
+    assert conf.route('show').methods == {'GET', 'HEAD'}
+    assert conf.route('update').methods == {'POST', 'PUT'}
+
+    def request(path, method):
+        return conf.create_response(Request.blank(path, method=method))
+
+    assert request('/article/1', 'GET').text == 'show 1'
+    assert request('/article/1', 'POST').text == 'update 1'
+    assert request('/article/1', 'PUT').text == 'update 1'
+    assert request('/any', 'DELETE').text == 'DELETE'
+    assert request('/any', 'GET').text == 'GET'
+    assert request('/article/1', 'HEAD').status_int == 200
+    response = request('/article/1', 'DELETE')
+    assert response.status_int == 405
+    assert response.headers['Allow'] == 'GET, HEAD, POST, PUT'
+    assert request('/article/1/2', 'DELETE').status_int == 404
+    post = RoutingState('/article/1', 'POST')
+    assert conf.route('show') not in \
+        list(conf._dispatcher_for(post).candidates(post))
+    request = Request.blank('/article/1', method='POST')
+    assert conf.find_route_for(request).name == 'update'
+    assert conf.find_route_for('/article/1').name == 'show'
+
+
+def test_method_not_allowed_respects_other_routes():
+    router = Router()
+    router.route('show', '/article/{id}', methods='GET')(
+        lambda ctx, id: 'show ' + id)
+
+    @router.route('fallback', '/{path>.*}')
+    def fallback(ctx, path):
+        return 'fallback'
+
+    @fallback.precondition
+    def never(ctx, path):
+        return False
+
+    conf = mkconf(router)
+    response = conf.create_response(Request.blank('/article/1',
+                                                  method='POST'))
+    assert response.status_int == 404
+
+
+def test_hosts():
+    router = Router()
+    router.route('tenant', '/', host='{tenant}.example.com')(
+        lambda ctx, tenant: 'tenant ' + tenant)
+    router.route('admin', '/', host='admin.example.com')(
+        lambda ctx: 'admin')
+    router.route('home', '/')(lambda ctx: 'home')
+    router.route('article', '/article/{id}', host='{tenant}.example.com')(
+        lambda ctx, tenant, id: 'article %s %s' % (tenant, id))
+    conf = mkconf(router)
+    assert list(conf.routes) == ['article', 'admin', 'tenant', 'home']
+
+    def request(url):
+        return conf.create_response(Request.blank(url)).text
+
+    assert request('http://admin.example.com/') == 'admin'
+    assert request('http://foo.example.com/') == 'tenant foo'
+    assert request('http://Foo.Example.com:8080/') == 'tenant foo'
+    assert request('http://example.net/') == 'home'
+    assert request('http://foo.bar.example.com/') == 'home'
+    assert request('http://bar.example.com/article/1') == 'article bar 1'
+    assert conf.create_response(
+        Request.blank('http://example.net/article/1')).status_int == 404
+    routing = RoutingState('/', host='example.net')
+    assert list(conf._dispatcher_for(routing).candidates(routing)) == \
+        [conf.route('home')]
+    assert conf.find_route_for('http://foo.example.com/').name == 'tenant'
+    assert conf.find_route_for('/').name == 'home'
+
+
+def test_mixed_case_hosts():
+    router = Router()
+    router.route('admin', '/', host='Admin.Example.com')(
+        lambda ctx: 'admin')
+    router.route('tenant', '/tenant', host='{tenant}.Example.com')(
+        lambda ctx, tenant: 'tenant ' + tenant)
+    router.route('home', '/')(lambda ctx: 'home')
+    conf = mkconf(router)
+
+    def request(url):
+        return conf.create_response(Request.blank(url)).text
+
+    assert request('http://admin.example.com/') == 'admin'
+    assert request('http://Admin.Example.com/') == 'admin'
+    assert request('http://Foo.EXAMPLE.com/tenant') == 'tenant foo'
+    assert request('http://example.com/') == 'home'
+
+
+def test_host_urls():
+    router = Router()
+    router.route('article', '/article/{article.id}',
+                 host='{article.tenant}.example.com')(
+        lambda ctx, article: None)
+    router.route('home', '/')(lambda ctx: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    ctx = conf.ctx.Context()
+    article = Mock(id=1, tenant='foo')
+    assert conf.url(ctx, 'article', article) == '//foo.example.com/article/1'
+    assert conf.url(ctx, 'article', article, _relative=True) == '/article/1'
+    assert conf.url(ctx, 'article', article,
+                    _urlbase='https://example.net') == \
+        'https://foo.example.com/article/1'
+    assert conf.url(ctx, 'home') == '/'
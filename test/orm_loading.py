@@ -0,0 +1,303 @@
+from score.ctx import init as init_score_ctx
+from score.http import init, RouterConfiguration as Router
+from webob import Request
+from unittest.mock import patch
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker  # noqa
+
+
+Base = declarative_base()
+
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    __score_sa_orm__ = {'parent': None}
+    id = sa.Column(sa.Integer, primary_key=True)
+    slug = sa.Column(sa.String, unique=True)
+    owner_id = sa.Column(sa.Integer, sa.ForeignKey('shop.id'))
+    owner = relationship('Shop', remote_side=[id])
+
+
+class Product(Base):
+    __tablename__ = 'product'
+    __score_sa_orm__ = {'parent': None}
+    id = sa.Column(sa.Integer, primary_key=True)
+    slug = sa.Column(sa.String, unique=True)
+    name = sa.Column(sa.String)
+    shop_id = sa.Column(sa.Integer, sa.ForeignKey('shop.id'))
+    shop = relationship(Shop)
+
+
+class Orm:
+
+    def __init__(self):
+        self.Base = Base
+        self.engine = sa.create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.queries = []
+        sa.event.listen(self.engine, 'before_cursor_execute',
+                        lambda *args: self.queries.append(args[2]))
+        shop = Shop(id=1, slug='cheese-shop')
+        self.session.add(shop)
+        self.session.add(Shop(id=2, slug='pet-shop', owner=shop))
+        self.session.add(Product(id=1, slug='camembert', name='Camembert',
+                                 shop=shop))
+        self.session.commit()
+        self.session.expunge_all()
+        self.queries.clear()
+
+    def get_session(self, ctx):
+        return self.session
+
+
+def init_conf(router, **confdict):
+    ctx = init_score_ctx()
+    ctx._finalize(object())
+    orm = Orm()
+    confdict['router'] = router
+    conf = init(confdict, ctx=ctx, orm=orm)
+    conf._finalize()
+    return conf, orm
+
+
+def test_single_query():
+    router = Router()
+
+    @router.route('product', '/{shop.slug}/{product.slug}')
+    def product(ctx, shop: Shop, product: Product):
+        return '%s/%s' % (shop.id, product.name)
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/cheese-shop/camembert'))
+    assert response.status_code == 200
+    assert response.text == '1/Camembert'
+    assert len(orm.queries) == 1
+
+
+def test_missing_entity():
+    router = Router()
+
+    @router.route('product', '/{shop.slug}/{product.slug}')
+    def product(ctx, shop: Shop, product: Product):
+        return product.name
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/cheese-shop/gouda'))
+    assert response.status_code == 404
+    assert len(orm.queries) == 1
+
+
+def test_same_class():
+    router = Router()
+
+    @router.route('shops', '/{first.slug}/vs/{second.slug}')
+    def shops(ctx, first: Shop, second: Shop):
+        return '%s %s' % (first.id, second.id)
+    conf, orm = init_conf(router)
+    response = conf.create_response(
+        Request.blank('/pet-shop/vs/cheese-shop'))
+    assert response.text == '2 1'
+    assert len(orm.queries) == 1
+
+
+def test_eager():
+    router = Router()
+
+    @router.route('product', '/{product.slug}',
+                  eager=('product.shop.owner',))
+    def product(ctx, product: Product):
+        return '%s %s' % (product.shop.slug, product.shop.owner)
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'cheese-shop None'
+    assert len(orm.queries) == 1
+
+
+def test_lazy():
+    router = Router()
+
+    @router.route('product', '/{product.slug}')
+    def product(ctx, product: Product):
+        return product.shop.slug
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'cheese-shop'
+    assert len(orm.queries) == 2
+
+
+def test_invalid_eager_hint():
+    router = Router()
+
+    @router.route('product', '/{product.slug}', eager='product.name')
+    def product(ctx, product: Product):
+        pass
+    with pytest.raises(Exception):
+        init_conf(router)
+
+
+def test_redirect():
+    router = Router()
+
+    @router.route('product', '/{shop.slug}/{product.id}/{product.slug}')
+    def product(ctx, shop: Shop, product: Product):
+        return product.name
+    conf, orm = init_conf(router)
+    response = conf.create_response(
+        Request.blank('/cheese-shop/1/camembert'))
+    assert response.status_code == 200
+    response = conf.create_response(Request.blank('/cheese-shop/1/brie'))
+    assert response.status_code in (301, 302)
+    assert response.location.endswith('/cheese-shop/1/camembert')
+
+
+def test_entity_cache():
+    router = Router()
+
+    @router.route('product', '/{product.slug}')
+    def product(ctx, product: Product):
+        assert product in orm.session
+        return product.name
+    conf, orm = init_conf(router, **{'orm.cache': True})
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'Camembert'
+    assert len(orm.queries) == 1
+    orm.session.expunge_all()
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'Camembert'
+    assert len(orm.queries) == 1
+    assert conf.entity_cache.stats['hits'] == 1
+
+
+def test_entity_cache_eviction():
+    router = Router()
+
+    @router.route('product', '/{product.slug}')
+    def product(ctx, product: Product):
+        return product.name
+    conf, orm = init_conf(router, **{'orm.cache': True})
+    conf.create_response(Request.blank('/camembert'))
+    orm.session.expunge_all()
+    camembert = orm.session.query(Product).filter(Product.id == 1).one()
+    camembert.name = 'Brie'
+    orm.session.commit()
+    orm.session.expunge_all()
+    orm.queries.clear()
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'Brie'
+    assert len(orm.queries) == 1
+
+
+def test_entity_cache_partial():
+    router = Router()
+
+    @router.route('shop', '/{shop.slug}')
+    def shop(ctx, shop: Shop):
+        return shop.slug
+
+    @router.route('product', '/{shop.slug}/{product.slug}')
+    def product(ctx, shop: Shop, product: Product):
+        return '%s/%s' % (shop.slug, product.name)
+    conf, orm = init_conf(router, **{'orm.cache': True})
+    conf.create_response(Request.blank('/cheese-shop'))
+    orm.session.expunge_all()
+    orm.queries.clear()
+    response = conf.create_response(Request.blank('/cheese-shop/camembert'))
+    assert response.text == 'cheese-shop/Camembert'
+    assert len(orm.queries) == 1
+    assert 'product' in orm.queries[0]
+    assert 'shop.slug' not in orm.queries[0]
+
+
+def test_entity_cache_ttl():
+    router = Router()
+
+    @router.route('product', '/{product.slug}')
+    def product(ctx, product: Product):
+        return product.name
+    conf, orm = init_conf(router, **{'orm.cache': True, 'orm.cache.ttl': 10})
+    with patch('time.monotonic', return_value=100):
+        conf.create_response(Request.blank('/camembert'))
+    orm.session.expunge_all()
+    with patch('time.monotonic', return_value=105):
+        conf.create_response(Request.blank('/camembert'))
+    assert len(orm.queries) == 1
+    orm.session.expunge_all()
+    with patch('time.monotonic', return_value=111):
+        conf.create_response(Request.blank('/camembert'))
+    assert len(orm.queries) == 2
+    assert conf.entity_cache.stats['expirations'] == 1
+
+
+def test_canonical_without_url_generation():
+    router = Router()
+
+    @router.route('product', '/{product.id}/{product.slug}')
+    def product(ctx, product: Product):
+        return product.name
+    conf, orm = init_conf(router)
+    route = conf.route('product')
+    with patch.object(route, 'url', wraps=route.url) as url:
+        response = conf.create_response(Request.blank('/1/camembert'))
+        assert response.status_code == 200
+        assert not url.called
+        response = conf.create_response(Request.blank('/1/brie?a=b'))
+        assert response.status_code in (301, 302)
+        assert response.location.endswith('/1/camembert?a=b')
+        assert url.call_count == 1
+
+
+def test_canonical_vars2urlparts():
+    router = Router()
+
+    @router.route('product', '/{product.id}/{product.slug}')
+    def product(ctx, product: Product):
+        return product.name
+
+    @product.vars2urlparts
+    def product_vars2urlparts(ctx, product):
+        return {'product.slug': product.slug.upper()}
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/1/CAMEMBERT'))
+    assert response.status_code == 200
+    response = conf.create_response(Request.blank('/1/camembert'))
+    assert response.status_code in (301, 302)
+    assert response.location.endswith('/1/CAMEMBERT')
+
+
+def test_lazy_entity():
+    router = Router()
+
+    @router.route('product', '/{product.slug}', lazy=True)
+    def product(ctx, product: Product):
+        if ctx.http.request.GET.get('details'):
+            return '%s %s' % (product.name, product.shop_id)
+        return 'ok'
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/camembert'))
+    assert response.text == 'ok'
+    assert len(orm.queries) == 1
+    assert 'name' not in orm.queries[0]
+    orm.session.expunge_all()
+    orm.queries.clear()
+    response = conf.create_response(Request.blank('/camembert?details=1'))
+    assert response.text == 'Camembert 1'
+    assert len(orm.queries) == 2
+    orm.session.expunge_all()
+    orm.queries.clear()
+    response = conf.create_response(Request.blank('/gouda'))
+    assert response.status_code == 404
+
+
+def test_lazy_entity_canonical():
+    router = Router()
+
+    @router.route('product', '/{product.id}/{product.slug}', lazy=True)
+    def product(ctx, product: Product):
+        return 'ok'
+    conf, orm = init_conf(router)
+    response = conf.create_response(Request.blank('/1/camembert'))
+    assert response.text == 'ok'
+    assert len(orm.queries) == 1
+    response = conf.create_response(Request.blank('/1/brie'))
+    assert response.location.endswith('/1/camembert')
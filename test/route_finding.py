@@ -1,5 +1,6 @@
 from score.ctx import init as init_score_ctx
 from score.http import init, RouterConfiguration as Router
+from unittest.mock import Mock
 
 
 def init_ctx():
@@ -43,3 +44,61 @@ def test_find_url_route_3():
     conf._finalize()
     assert conf.find_route_for('/foo').name == 'route'
     assert conf.find_route_for('/bar') == None
+
+
+def test_classify():
+    router = Router()
+    router.route('about', '/about')(lambda ctx: None)
+
+    @router.route('number', '/{value}')
+    def number(ctx, value):
+        pass
+
+    @number.match2vars
+    def number_match2vars(ctx, matches):
+        if matches['value'].isdigit():
+            return {'value': int(matches['value'])}
+
+    router.route('word', '/{value>.*}', after='number')(
+        lambda ctx, value: None)
+    router.route('article', '/article/{article.id}')(
+        lambda ctx, article: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    urls = ['/about', '/42', '/foo', 'http://example.net/a%20b', '/article/1']
+    result = list((url, route.name if route else None, variables)
+                  for url, route, variables in conf.classify(urls))
+    assert result == [
+        ('/about', 'about', {}),
+        ('/42', 'number', {'value': 42}),
+        ('/foo', 'word', {'value': 'foo'}),
+        ('http://example.net/a%20b', 'word', {'value': 'a b'}),
+        ('/article/1', 'article', {}),
+    ]
+    result = list((url, route.name if route else None, variables)
+                  for url, route, variables
+                  in conf.classify(urls, match_only=True))
+    assert result == [
+        ('/about', 'about', {}),
+        ('/42', 'number', {'value': '42'}),
+        ('/foo', 'number', {'value': 'foo'}),
+        ('http://example.net/a%20b', 'number', {'value': 'a b'}),
+        ('/article/1', 'article', {'article.id': '1'}),
+    ]
+
+
+def test_classify_uses_one_context_per_url():
+    router = Router()
+    for i in range(20):
+        router.route('route%d' % i, '/{a}/%d' % i)(lambda ctx, a: None)
+    router.route('last', '/{a}/{b}')(lambda ctx, a, b: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    conf.set_ctx_http_member = Mock(wraps=conf.set_ctx_http_member)
+    result = list(conf.classify(['/a/b', '/a/1', '/a']))
+    assert list(route.name if route else None
+                for url, route, variables in result) == \
+        ['last', 'route1', None]
+    assert conf.set_ctx_http_member.call_count == 3
+    result = list(conf.classify(['/a/b', '/a/1', '/a'], match_only=True))
+    assert conf.set_ctx_http_member.call_count == 3
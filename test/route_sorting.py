@@ -1,10 +1,14 @@
 from score.ctx import init as init_score_ctx
 from score.http import (
     init, RouterConfiguration as Router, DependencyLoop,
-    DuplicateRouteDefinition)
+    DuplicateRouteDefinition, InitializationError)
 from score.http._conf import RouteConfiguration
+from score.http._urltpl import PatternUrlTemplate as PatternUrl
+from score.init import DependencySolver
+from itertools import permutations
+import random
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 
 def init_ctx():
@@ -151,3 +155,153 @@ def test_loop_3():
     router.route('c', '/c', before='a')(Mock())
     with pytest.raises(DependencyLoop):
         init({'router': router}, ctx=init_ctx())._finalize()
+
+
+def mkrouter(count, seed, constraints=0):
+    """
+    Creates a router with *count* routes having distinct url templates.
+    """
+    rnd = random.Random(seed)
+    segments = ('a', 'ab', 'b', 'api', 'user', 'users', '{x%d}', '{y%d>\\d+}',
+                'x{z%d}', '{w%d}.html', '%d')
+    router = Router()
+    seen = set()
+    while len(router.routes) < count:
+        pattern = '/' + '/'.join(
+            rnd.choice(segments).replace('%d', str(i))
+            for i in range(rnd.randint(0, 5)))
+        # templates differing in their regular expressions only would be
+        # ambiguous, so we are only considering the literal parts
+        key = tuple(part.pattern if not part.is_regex else None
+                    for part in PatternUrl(pattern).parts)
+        if key in seen:
+            continue
+        seen.add(key)
+        kwargs = {}
+        if len(router.routes) < constraints and router.routes:
+            constraint = rnd.choice(('before', 'after'))
+            kwargs[constraint] = rnd.choice(list(router.routes))
+        router.route('r%d' % len(router.routes), pattern, **kwargs)(Mock())
+    return router
+
+
+def pairwise_sorted_routes(router):
+    """
+    The original implementation of RouterConfiguration.sorted_routes() for
+    unconstrained routes, which compares every pair of routes.
+    """
+    depsolv = DependencySolver()
+    for r1, r2 in permutations(router.routes.values(), 2):
+        if r1.urltpl.equals(r2.urltpl):
+            continue
+        if r1.urltpl < r2.urltpl:
+            depsolv.add_dependency(r1.name, r2.name)
+        else:
+            depsolv.add_dependency(r2.name, r1.name)
+    for route in router.routes.values():
+        depsolv.add_dependency(route.name)
+    return list(router.routes[n] for n in reversed(depsolv.solve()))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sort_key_matches_pairwise_comparison(seed):
+    router = mkrouter(300, seed)
+    expected = list(route.name for route in pairwise_sorted_routes(router))
+    assert list(route.name for route in router.sorted_routes()) == expected
+
+
+def test_large_table():
+    router = mkrouter(5000, 42)
+    routes = router.sorted_routes()
+    assert len(routes) == 5000
+    for r1, r2 in zip(routes, routes[1:]):
+        assert r1.urltpl < r2.urltpl
+        assert not (r2.urltpl < r1.urltpl)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_constraints_in_large_table(seed):
+    router = mkrouter(500, seed, constraints=20)
+    routes = list(route.name for route in router.sorted_routes())
+    assert len(routes) == 500
+    for route in router.routes.values():
+        for other in route.before:
+            assert routes.index(route.name) < routes.index(other)
+        for other in route.after:
+            assert routes.index(route.name) > routes.index(other)
+    unconstrained = list(route for route in router.routes.values()
+                         if not route.before and not route.after)
+    unconstrained.sort(key=lambda route: route.urltpl.sort_key)
+    assert list(name for name in routes
+                if not router.routes[name].before and
+                not router.routes[name].after) == \
+        list(route.name for route in unconstrained)
+
+
+def test_ambiguous_routes():
+    router = Router()
+    router.route('user', '/{user>\\d+}')(Mock())
+    router.route('name', '/{name>[a-z]+}')(Mock())
+    with pytest.raises(DependencyLoop):
+        router.sorted_routes()
+    router = Router()
+    router.route('user', '/{user>\\d+}', before='name')(Mock())
+    router.route('name', '/{name>[a-z]+}')(Mock())
+    assert list(route.name for route in router.sorted_routes()) == \
+        ['user', 'name']
+
+
+def test_unknown_constraint():
+    router = Router()
+    router.route('a', '/a', before='b')(Mock())
+    with pytest.raises(InitializationError):
+        router.sorted_routes()
+
+
+def test_routing_table_cache(tmp_path):
+    cachefile = str(tmp_path / 'routes.json')
+
+    def mkconf(router):
+        conf = init({'router': router, 'routing.table_cache': cachefile},
+                    ctx=init_ctx())
+        conf._finalize()
+        return conf
+
+    router = mkrouter(50, 0)
+    router.route('login', '/login')(Mock())
+    conf = mkconf(router)
+    expected = list(conf.routes)
+    with open(cachefile) as file:
+        assert 'login' in file.read()
+    router.sorted_routes = Mock(side_effect=AssertionError)
+    conf = mkconf(router)
+    assert list(conf.routes) == expected
+    assert conf.dispatcher.literals['/login'] == (conf.route('login'),)
+    assert not router.sorted_routes.called
+    router.route('new', '/new', before='login')(Mock())
+    del router.sorted_routes
+    conf = mkconf(router)
+    assert list(conf.routes) != expected
+    assert conf.dispatcher.literals['/login'] == (conf.route('login'),)
+    assert list(conf.routes).index('new') < list(conf.routes).index('login')
+
+
+def test_broken_routing_table_cache(tmp_path):
+    cachefile = tmp_path / 'routes.json'
+    cachefile.write_text('{"fingerprint": ')
+    router = mkrouter(10, 0)
+    conf = init({'router': router, 'routing.table_cache': str(cachefile)},
+                ctx=init_ctx())
+    conf._finalize()
+    assert list(conf.routes) == \
+        list(route.name for route in router.sorted_routes())
+
+
+def test_fingerprint_versions():
+    router = mkrouter(5, 0)
+    fingerprint = router.fingerprint()
+    assert router.fingerprint() == fingerprint
+    with patch('score.http.__version__', '0.0.0'):
+        assert router.fingerprint() != fingerprint
+    with patch('score.http._conf.ROUTING_TABLE_FORMAT', 0):
+        assert router.fingerprint() != fingerprint
@@ -0,0 +1,477 @@
+from score.ctx import init as init_score_ctx
+from score.http import init, RouterConfiguration as Router
+from score.http._static import (
+    FileIter, MappedFiles, MmapFileIter, StaticFileCache,
+    parse_accept_encoding, parse_ranges,
+    resolve_path)
+from webob.exc import HTTPNotFound
+from webob import Request
+from unittest.mock import patch
+import mimetypes
+import os
+import pytest
+
+
+def init_conf(rootdir, **kwargs):
+    router = Router()
+    router.define_static_route('static', '/static/{path>.*}', str(rootdir),
+                               **kwargs)
+    ctx = init_score_ctx()
+    ctx._finalize(object())
+    conf = init({'router': router}, ctx=ctx)
+    conf._finalize()
+    return conf
+
+
+@pytest.fixture
+def rootdir(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    tmpdir.join('secret.txt').write('secret')
+    tmpdir.mkdir('public')
+    return tmpdir.join('public')
+
+
+def test_serve_file(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    conf = init_conf(tmpdir)
+    response = conf.create_response(Request.blank('/static/style.css'))
+    assert response.status_code == 200
+    assert response.content_type == 'text/css'
+    assert response.content_length == 20
+    assert isinstance(response.app_iter, FileIter)
+    assert response.body == b'body { color: red; }'
+
+
+def test_file_wrapper(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    conf = init_conf(tmpdir)
+    wrapped = []
+
+    def file_wrapper(file, block_size):
+        wrapped.append(file.name)
+        return iter([file.read()])
+    request = Request.blank('/static/style.css',
+                            environ={'wsgi.file_wrapper': file_wrapper})
+    response = conf.create_response(request)
+    assert wrapped == [str(tmpdir.join('style.css'))]
+    assert response.content_length == 20
+    assert response.body == b'body { color: red; }'
+
+
+def test_missing_file(tmpdir):
+    tmpdir.mkdir('folder')
+    conf = init_conf(tmpdir)
+    for path in ('/static/missing.css', '/static/folder',
+                 '/static/folder/missing.css'):
+        response = conf.create_response(Request.blank(path))
+        assert response.status_code == 404
+
+
+def test_outside_of_rootdir(rootdir):
+    conf = init_conf(rootdir)
+    for path in ('/static/../secret.txt', '/static/%2E%2E/secret.txt',
+                 '/static//etc/passwd'):
+        response = conf.create_response(Request.blank(path))
+        assert response.status_code == 404
+
+
+def test_block_size():
+    class File:
+        def __init__(self):
+            self.reads = []
+
+        def read(self, size):
+            self.reads.append(size)
+            return b'' if len(self.reads) > 2 else b'x'
+    file = File()
+    assert b''.join(FileIter(file, 1024)) == b'xx'
+    assert file.reads == [1024, 1024, 1024]
+
+
+def test_resolve_path():
+    assert resolve_path('/srv/www', 'css/style.css') == \
+        '/srv/www/css/style.css'
+    for path in ('../secret.txt', 'css/../../secret.txt', '/etc/passwd',
+                 '../www2/file.txt'):
+        with pytest.raises(HTTPNotFound):
+            resolve_path('/srv/www', path)
+
+
+def test_validators(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    os.utime(str(tmpdir.join('style.css')), (1500000000, 1500000000))
+    conf = init_conf(tmpdir, cache_control='public, max-age=60')
+    response = conf.create_response(Request.blank('/static/style.css'))
+    assert response.etag
+    assert response.last_modified.timestamp() == 1500000000
+    assert response.headers['Cache-Control'] == 'public, max-age=60'
+
+
+def test_if_none_match(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    conf = init_conf(tmpdir, cache_control='no-cache')
+    etag = conf.create_response(Request.blank('/static/style.css')).etag
+    request = Request.blank('/static/style.css',
+                            headers={'If-None-Match': '"%s"' % etag})
+    with patch('score.http._static.open', create=True) as open_:
+        response = conf.create_response(request)
+    assert not open_.called
+    assert response.status_code == 304
+    assert response.body == b''
+    assert 'Content-Type' not in response.headers
+    assert response.etag == etag
+    assert response.headers['Cache-Control'] == 'no-cache'
+    request = Request.blank('/static/style.css',
+                            headers={'If-None-Match': '"other"'})
+    response = conf.create_response(request)
+    assert response.status_code == 200
+    request = Request.blank('/static/style.css', method='POST',
+                            headers={'If-None-Match': '"%s"' % etag})
+    assert conf.create_response(request).status_code == 200
+
+
+def test_if_modified_since(tmpdir):
+    tmpdir.join('style.css').write('body { color: red; }')
+    os.utime(str(tmpdir.join('style.css')), (1500000000, 1500000000))
+    conf = init_conf(tmpdir)
+    request = Request.blank('/static/style.css')
+    request.if_modified_since = 1500000000
+    assert conf.create_response(request).status_code == 304
+    request.if_modified_since = 1499999999
+    assert conf.create_response(request).status_code == 200
+    # If-None-Match takes precedence
+    request.if_modified_since = 1500000000
+    request.headers['If-None-Match'] = '"other"'
+    assert conf.create_response(request).status_code == 200
+
+
+def test_parse_ranges():
+    assert parse_ranges('bytes=0-9', 100) == [(0, 10)]
+    assert parse_ranges('bytes=90-', 100) == [(90, 100)]
+    assert parse_ranges('bytes=-10', 100) == [(90, 100)]
+    assert parse_ranges('bytes=-200', 100) == [(0, 100)]
+    assert parse_ranges('bytes=90-200', 100) == [(90, 100)]
+    assert parse_ranges('bytes=50-59, 0-9', 100) == [(0, 10), (50, 60)]
+    assert parse_ranges('bytes=0-9,5-19,20-29', 100) == [(0, 30)]
+    assert parse_ranges('bytes=100-', 100) == []
+    assert parse_ranges('bytes=-0', 100) == []
+    assert parse_ranges('bytes=100-,0-0', 100) == [(0, 1)]
+    for header in ('items=0-9', 'bytes=', 'bytes=9-0', 'bytes=a-b',
+                   'bytes=-', 'bytes=0-+1', 'bytes=5', 'bytes=\xb2-5',
+                   'bytes=0-\xb2'):
+        assert parse_ranges(header, 100) is None, header
+
+
+def test_range(tmpdir):
+    tmpdir.join('file.txt').write('0123456789')
+    conf = init_conf(tmpdir)
+    response = conf.create_response(Request.blank('/static/file.txt'))
+    assert response.accept_ranges == 'bytes'
+    request = Request.blank('/static/file.txt', range=(2, 5))
+    response = conf.create_response(request)
+    assert response.status_code == 206
+    assert response.body == b'234'
+    assert response.content_length == 3
+    assert response.headers['Content-Range'] == 'bytes 2-4/10'
+    assert response.content_type == 'text/plain'
+    request = Request.blank('/static/file.txt',
+                            headers={'Range': 'bytes=\xb2-5'})
+    response = conf.create_response(request)
+    assert response.status_code == 200
+    assert response.body == b'0123456789'
+
+
+def test_range_unsatisfiable(tmpdir):
+    tmpdir.join('file.txt').write('0123456789')
+    conf = init_conf(tmpdir)
+    request = Request.blank('/static/file.txt',
+                            headers={'Range': 'bytes=20-30'})
+    response = conf.create_response(request)
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */10'
+    assert response.body == b''
+
+
+def test_range_ignored(tmpdir):
+    tmpdir.join('file.txt').write('0123456789')
+    conf = init_conf(tmpdir)
+    for headers in ({'Range': 'bytes=9-2'},
+                    {'Range': 'bytes=2-4', 'If-Range': '"other"'},
+                    {'Range': 'bytes=2-4', 'If-Range': 'W/"other"'},
+                    {'Range': 'bytes=2-4',
+                     'If-Range': 'Tue, 15 Nov 1994 08:12:31 GMT'}):
+        request = Request.blank('/static/file.txt', headers=headers)
+        response = conf.create_response(request)
+        assert response.status_code == 200
+        assert response.body == b'0123456789'
+    request = Request.blank('/static/file.txt', method='POST',
+                            headers={'Range': 'bytes=2-4'})
+    assert conf.create_response(request).status_code == 200
+
+
+def test_if_range(tmpdir):
+    tmpdir.join('file.txt').write('0123456789')
+    os.utime(str(tmpdir.join('file.txt')), (1500000000, 1500000000))
+    conf = init_conf(tmpdir)
+    etag = conf.create_response(Request.blank('/static/file.txt')).etag
+    for value in ('"%s"' % etag, 'Fri, 14 Jul 2017 02:40:00 GMT'):
+        request = Request.blank('/static/file.txt', headers={
+            'Range': 'bytes=2-4', 'If-Range': value})
+        response = conf.create_response(request)
+        assert response.status_code == 206
+        assert response.body == b'234'
+
+
+def test_multiple_ranges(tmpdir):
+    tmpdir.join('file.txt').write('0123456789')
+    conf = init_conf(tmpdir)
+    request = Request.blank('/static/file.txt',
+                            headers={'Range': 'bytes=7-,0-1'})
+    response = conf.create_response(request)
+    assert response.status_code == 206
+    assert response.content_type == 'multipart/byteranges'
+    boundary = response.headers['Content-Type'].split('boundary=')[1]
+    body = response.body
+    assert len(body) == response.content_length
+    assert body == (
+        '--{0}\r\nContent-Type: text/plain\r\n'
+        'Content-Range: bytes 0-1/10\r\n\r\n01\r\n'
+        '--{0}\r\nContent-Type: text/plain\r\n'
+        'Content-Range: bytes 7-9/10\r\n\r\n789\r\n'
+        '--{0}--\r\n').format(boundary).encode('ascii')
+
+
+def test_range_seeks():
+    class File:
+        def __init__(self):
+            self.calls = []
+
+        def seek(self, offset):
+            self.calls.append(('seek', offset))
+
+        def read(self, size):
+            self.calls.append(('read', size))
+            return b'x' * size
+    file = File()
+    assert b''.join(FileIter(file, 4, 1000, 1010)) == b'x' * 10
+    assert file.calls == [('seek', 1000), ('read', 4), ('read', 4),
+                          ('read', 2)]
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.5, *;q=0') == \
+        {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    assert parse_accept_encoding('GZIP;Q=0.3,, deflate;q=x') == \
+        {'gzip': 0.3, 'deflate': 0.0}
+
+
+@pytest.fixture
+def compressed(tmpdir):
+    tmpdir.join('app.js').write('original')
+    tmpdir.join('app.js.gz').write('gzipped')
+    tmpdir.join('app.js.br').write('brotli')
+    tmpdir.join('other.js').write('other')
+    return tmpdir
+
+
+def fetch(conf, path, accept_encoding=None, **headers):
+    if accept_encoding is not None:
+        headers['Accept-Encoding'] = accept_encoding
+    return conf.create_response(Request.blank(path, headers=headers))
+
+
+def test_precompressed(compressed):
+    conf = init_conf(compressed, precompressed=True)
+    expected = (
+        (None, b'original', None),
+        ('gzip', b'gzipped', 'gzip'),
+        ('gzip, br', b'brotli', 'br'),
+        ('gzip, br;q=0.5', b'gzipped', 'gzip'),
+        ('*', b'brotli', 'br'),
+        ('deflate', b'original', None),
+        ('br;q=0, *', b'gzipped', 'gzip'),
+        ('gzip;q=0.5, identity', b'original', None),
+    )
+    for accept_encoding, body, encoding in expected:
+        response = fetch(conf, '/static/app.js', accept_encoding)
+        assert response.body == body, accept_encoding
+        assert response.content_encoding == encoding, accept_encoding
+        assert response.content_type == mimetypes.guess_type('app.js')[0]
+        assert response.vary == ('Accept-Encoding',)
+    response = fetch(conf, '/static/other.js', 'gzip, br')
+    assert response.body == b'other'
+    assert response.vary == ('Accept-Encoding',)
+
+
+def test_precompressed_preference(compressed):
+    conf = init_conf(compressed, precompressed=['gzip', 'br'])
+    assert fetch(conf, '/static/app.js', 'br, gzip').body == b'gzipped'
+    conf = init_conf(compressed, precompressed='br')
+    assert fetch(conf, '/static/app.js', 'gzip').body == b'original'
+
+
+def test_precompressed_disabled(compressed):
+    conf = init_conf(compressed)
+    response = fetch(conf, '/static/app.js', 'gzip, br')
+    assert response.body == b'original'
+    assert response.vary is None
+
+
+def test_precompressed_validators(compressed):
+    conf = init_conf(compressed, precompressed=True)
+    original = fetch(conf, '/static/app.js').etag
+    gzipped = fetch(conf, '/static/app.js', 'gzip').etag
+    assert original != gzipped
+    response = fetch(conf, '/static/app.js', 'gzip',
+                     **{'If-None-Match': '"%s"' % gzipped})
+    assert response.status_code == 304
+    assert response.vary == ('Accept-Encoding',)
+    response = fetch(conf, '/static/app.js', 'gzip', Range='bytes=0-1')
+    assert response.status_code == 206
+    assert response.body == b'gz'
+    assert response.content_encoding == 'gzip'
+
+
+def test_precompressed_variant_cache(compressed):
+    conf = init_conf(compressed, precompressed=True)
+    with patch('os.path.isfile', wraps=os.path.isfile) as isfile:
+        fetch(conf, '/static/app.js', 'gzip')
+        fetch(conf, '/static/app.js', 'br')
+    assert isfile.call_count == 2
+    compressed.join('app.js.gz').remove()
+    compressed.join('app.js.br').remove()
+    response = fetch(conf, '/static/app.js', 'gzip')
+    assert response.body == b'original'
+    assert response.content_encoding is None
+
+
+def test_file_cache(tmpdir):
+    tmpdir.join('icon.svg').write('<svg/>')
+    cache = StaticFileCache()
+    conf = init_conf(tmpdir, file_cache=cache)
+    assert fetch(conf, '/static/icon.svg').body == b'<svg/>'
+    assert len(cache) == 1
+    with patch('score.http._static.open', create=True) as open_:
+        response = fetch(conf, '/static/icon.svg')
+        assert response.body == b'<svg/>'
+        assert response.content_length == 6
+        assert response.content_type == 'image/svg+xml'
+        response = fetch(conf, '/static/icon.svg', Range='bytes=1-3')
+        assert response.body == b'svg'
+        response = fetch(conf, '/static/icon.svg',
+                         **{'If-None-Match': '"%s"' % response.etag})
+        assert response.status_code == 304
+    assert not open_.called
+    assert cache.stats['hits'] == 3
+
+
+def test_file_cache_modification(tmpdir):
+    tmpdir.join('icon.svg').write('<svg/>')
+    conf = init_conf(tmpdir, file_cache=True)
+    assert fetch(conf, '/static/icon.svg').body == b'<svg/>'
+    tmpdir.join('icon.svg').write('<svg></svg>')
+    assert fetch(conf, '/static/icon.svg').body == b'<svg></svg>'
+    tmpdir.join('icon.svg').remove()
+    assert fetch(conf, '/static/icon.svg').status_code == 404
+
+
+def test_file_cache_revalidate(tmpdir):
+    tmpdir.join('icon.svg').write('<svg/>')
+    conf = init_conf(tmpdir, file_cache=StaticFileCache(revalidate=10))
+    with patch('time.monotonic', return_value=100):
+        fetch(conf, '/static/icon.svg')
+    tmpdir.join('icon.svg').write('<svg></svg>')
+    with patch('time.monotonic', return_value=105):
+        assert fetch(conf, '/static/icon.svg').body == b'<svg/>'
+    with patch('time.monotonic', return_value=110):
+        assert fetch(conf, '/static/icon.svg').body == b'<svg></svg>'
+
+
+def test_file_cache_bounds(tmpdir):
+    for name in ('a', 'b', 'c'):
+        tmpdir.join(name).write(name * 40)
+    tmpdir.join('large').write('x' * 60)
+    cache = StaticFileCache(max_bytes=100, max_file_size=50)
+    conf = init_conf(tmpdir, file_cache=cache)
+    fetch(conf, '/static/large')
+    assert len(cache) == 0
+    fetch(conf, '/static/a')
+    fetch(conf, '/static/b')
+    assert len(cache) == 2
+    fetch(conf, '/static/a')
+    fetch(conf, '/static/c')
+    assert len(cache) == 2
+    assert cache.stats['currsize'] == 80
+    assert cache.stats['evictions'] == 1
+    assert cache.get(str(tmpdir.join('b'))) is None
+    assert cache.get(str(tmpdir.join('a'))) is not None
+    with pytest.raises(ValueError):
+        StaticFileCache(max_bytes=10, max_file_size=20)
+
+
+@pytest.fixture
+def large(tmpdir):
+    tmpdir.join('video.mp4').write_binary(bytes(range(256)) * 40)
+    return tmpdir
+
+
+def test_mmap(large):
+    mapped_files = MappedFiles(threshold=1000)
+    conf = init_conf(large, mmap=mapped_files)
+    response = fetch(conf, '/static/video.mp4')
+    assert isinstance(response.app_iter, MmapFileIter)
+    assert len(mapped_files) == 1
+    # webob closes the app_iter after reading the body
+    assert response.body == bytes(range(256)) * 40
+    assert len(mapped_files) == 0
+
+
+def test_mmap_threshold(large):
+    large.join('small.txt').write('small')
+    conf = init_conf(large, mmap=MappedFiles(threshold=20000))
+    response = fetch(conf, '/static/video.mp4')
+    assert isinstance(response.app_iter, FileIter)
+    conf = init_conf(large, mmap=True)
+    response = fetch(conf, '/static/small.txt')
+    assert isinstance(response.app_iter, FileIter)
+
+
+def test_mmap_shared(large):
+    mapped_files = MappedFiles(threshold=1000, memoryviews=True)
+    conf = init_conf(large, mmap=mapped_files)
+    first = fetch(conf, '/static/video.mp4')
+    second = fetch(conf, '/static/video.mp4', Range='bytes=256-511')
+    assert first.app_iter.mapped is second.app_iter.mapped
+    assert len(mapped_files) == 1
+    chunks = list(second.app_iter)
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert b''.join(chunks) == bytes(range(256))
+    del chunks
+    second.app_iter.close()
+    assert len(mapped_files) == 1
+    first.app_iter.close()
+    assert len(mapped_files) == 0
+
+
+def test_mmap_ranges(large):
+    conf = init_conf(large, mmap=MappedFiles(threshold=1000))
+    response = fetch(conf, '/static/video.mp4', Range='bytes=-2,0-1')
+    assert response.status_code == 206
+    assert isinstance(response.app_iter.source, MmapFileIter)
+    assert len(response.body) == response.content_length
+    assert b'\r\n\x00\x01\r\n' in response.body
+    assert b'\r\n\xfe\xff\r\n' in response.body
+
+
+def test_mmap_block_size(large):
+    mapped_files = MappedFiles(threshold=1000)
+    with open(str(large.join('video.mp4')), 'rb') as file:
+        stat = os.fstat(file.fileno())
+        app_iter = mapped_files.iter('video.mp4', file, stat, 10, 10250)
+        app_iter.block_size = 4096
+        chunks = list(app_iter)
+    assert list(map(len, chunks)) == [4096, 4096, 2038]
+    assert b''.join(chunks) == (bytes(range(256)) * 40)[10:]
+    app_iter.close()
+    app_iter.close()
+    assert len(mapped_files) == 0
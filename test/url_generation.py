@@ -1,8 +1,9 @@
 from score.ctx import init as init_score_ctx
 from score.http import init, RouterConfiguration as Router
-from score.http._urltpl import InvalidVariable
+from score.http._urltpl import (
+    InvalidVariable, MissingVariable, PatternUrlTemplate)
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 
 def init_ctx():
@@ -85,3 +86,206 @@ def test_pathed_variable_3():
     conf._finalize()
     with pytest.raises(InvalidVariable):
         conf.route('route').url(conf.ctx.Context(), object())
+
+
+def test_skip_validation():
+    router = Router()
+    router.route('route', r'/foo/{var>\d+}')(
+        lambda var: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    assert conf.route('route').url(
+        conf.ctx.Context(), 'bar', _validate=False) == '/foo/bar'
+
+
+def test_generate_quotes_values():
+    urltpl = PatternUrlTemplate('/{first}/and/{second}')
+    assert urltpl.generate(first='Sir Lancelot', second=42) == \
+        '/Sir%20Lancelot/and/42'
+
+
+def test_generate_missing_variable():
+    urltpl = PatternUrlTemplate('/{first}/and/{second}')
+    with pytest.raises(MissingVariable):
+        urltpl.generate(first='foo')
+    with pytest.raises(MissingVariable):
+        urltpl.generate(first='foo', _validate=False)
+
+
+def test_generate_literal():
+    urltpl = PatternUrlTemplate('/foo/bar')
+    assert urltpl.generate() == '/foo/bar'
+    assert urltpl.generate(unused='baz') == '/foo/bar'
+
+
+def test_generate_host():
+    urltpl = PatternUrlTemplate('/{page}', host='{user>[a-z]+}.example.com')
+    assert urltpl.generate_host(user='arthur', page=1) == 'arthur.example.com'
+    with pytest.raises(InvalidVariable):
+        urltpl.generate_host(user='Arthur')
+    assert urltpl.generate_host(user='Arthur', _validate=False) == \
+        'Arthur.example.com'
+
+
+def test_pathed_variable_keyword():
+    router = Router()
+    router.route('route', '/{article.author.slug}/{article.id}')(
+        lambda article: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    article = Mock(id=123, author=Mock(slug='author-slug'))
+    assert conf.route('route').url(conf.ctx.Context(), article=article) == \
+        '/author-slug/123'
+    assert conf.route('route').url(
+        conf.ctx.Context(), article, **{'article.id': 456}) == \
+        '/author-slug/456'
+    with pytest.raises(MissingVariable):
+        conf.route('route').url(conf.ctx.Context())
+
+
+def test_signature_inspected_once():
+    router = Router()
+    router.route('route', '/{article.id}')(
+        lambda article: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    with patch('inspect.signature') as signature:
+        for i in range(3):
+            assert conf.route('route').url(
+                conf.ctx.Context(), Mock(id=i)) == '/%d' % i
+    assert not signature.called
+
+
+def test_urls():
+    router = Router()
+    router.route('route', '/{article.id}')(
+        lambda article: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    articles = [Mock(id=i) for i in range(3)]
+    urls = conf.route('route').urls(
+        conf.ctx.Context(), articles, _query={'a': 'b'}, _anchor='top',
+        _urlbase='http://example.com')
+    assert list(urls) == [
+        'http://example.com/0?a=b#top',
+        'http://example.com/1?a=b#top',
+        'http://example.com/2?a=b#top',
+    ]
+    assert list(conf.urls(conf.ctx.Context(), 'route', articles[:1])) == \
+        ['/0']
+
+
+def test_urls_shared_kwargs():
+    router = Router()
+    router.route('route', '/{category}/{article.id}')(
+        lambda category, article: None)
+    conf = init({'router': router}, ctx=init_ctx())
+    conf._finalize()
+    urls = conf.route('route').urls(
+        conf.ctx.Context(), (Mock(id=i) for i in range(2)), category='news')
+    assert list(urls) == ['/news/0', '/news/1']
+
+
+def init_cached(router, size=1000):
+    conf = init({'router': router, 'url.cache': True,
+                 'url.cache.size': size}, ctx=init_ctx())
+    conf._finalize()
+    return conf
+
+
+def test_url_cache():
+    router = Router()
+    router.route('route', '/{article.slug}')(
+        lambda article: None)
+    conf = init_cached(router)
+    article = Mock(slug='foo')
+    ctx = conf.ctx.Context()
+    assert conf.route('route').url(ctx, article) == '/foo'
+    article.slug = 'bar'
+    assert conf.route('route').url(ctx, article) == '/foo'
+    assert conf.url_cache.stats['hits'] == 1
+    assert conf.url_cache.stats['misses'] == 1
+    assert conf.url_cache.stats['hit_rate'] == 0.5
+    assert conf.invalidate_urls(obj=article) == 1
+    assert conf.route('route').url(ctx, article) == '/bar'
+
+
+def test_url_cache_options():
+    router = Router()
+    router.route('route', '/{var}')(
+        lambda var: None)
+    conf = init_cached(router)
+    ctx = conf.ctx.Context()
+    assert conf.route('route').url(ctx, 'foo') == '/foo'
+    assert conf.route('route').url(ctx, 'foo', _anchor='a') == '/foo#a'
+    assert conf.route('route').url(
+        ctx, 'foo', _urlbase='http://example.com') == 'http://example.com/foo'
+    assert conf.route('route').url(ctx, 'bar') == '/bar'
+    assert conf.route('route').url(ctx, 'foo') == '/foo'
+    assert conf.url_cache.stats['hits'] == 1
+    assert len(conf.url_cache) == 4
+
+
+def test_url_cache_unhashable():
+    router = Router()
+    router.route('route', '/{var}')(
+        lambda var: None)
+    conf = init_cached(router)
+    ctx = conf.ctx.Context()
+    assert conf.route('route').url(ctx, 'foo', _query={'a': 'b'}) == \
+        '/foo?a=b'
+    assert conf.route('route').url(ctx, ['foo']) == "/%5B%27foo%27%5D"
+    assert conf.route('route').url(ctx, var=['foo']) == "/%5B%27foo%27%5D"
+    assert len(conf.url_cache) == 1
+
+
+def test_url_cache_bypass():
+    router = Router()
+    counter = Mock(return_value='/counted')
+    router.route('cached', '/{var}')(
+        lambda var: None)
+    router.route('uncached', '/foo/{var}', cache_urls=False)(
+        lambda var: None)
+    route = router.route('vars2url', '/bar/{var}')(
+        lambda var: None)
+    route.vars2url(lambda ctx, var: counter())
+    conf = init_cached(router)
+    ctx = conf.ctx.Context()
+    for i in range(2):
+        assert conf.route('uncached').url(ctx, 'x') == '/foo/x'
+        assert conf.route('vars2url').url(ctx, 'x') == '/counted'
+    assert counter.call_count == 2
+    assert len(conf.url_cache) == 0
+
+
+def test_url_cache_invalidate_route():
+    router = Router()
+    router.route('first', '/first/{var}')(
+        lambda var: None)
+    router.route('second', '/second/{var}')(
+        lambda var: None)
+    conf = init_cached(router)
+    ctx = conf.ctx.Context()
+    for name in ('first', 'second'):
+        for var in ('a', 'b'):
+            conf.route(name).url(ctx, var)
+    assert conf.invalidate_urls(route='first') == 2
+    assert conf.invalidate_urls(route=conf.route('second')) == 2
+    conf.route('first').url(ctx, 'a')
+    assert conf.invalidate_urls() == 1
+    assert len(conf.url_cache) == 0
+
+
+def test_url_cache_key():
+    router = Router()
+    router.route('route', '/{article.id}/{article.slug}',
+                 cache_urls=lambda ctx, article: (article.id, article.slug))(
+        lambda article: None)
+    conf = init_cached(router)
+    ctx = conf.ctx.Context()
+    assert conf.route('route').url(ctx, Mock(id=1, slug='foo')) == '/1/foo'
+    assert conf.route('route').url(ctx, Mock(id=1, slug='foo')) == '/1/foo'
+    assert conf.route('route').url(ctx, Mock(id=1, slug='bar')) == '/1/bar'
+    assert conf.url_cache.stats['hits'] == 1
+    assert len(conf.url_cache) == 2
+    assert conf.invalidate_urls(route='route') == 2
@@ -85,3 +85,20 @@ def test_string_precedence_3():
     url1 = PatternUrl('{a}/a')
     url2 = PatternUrl('{b}/b')
     assert url1 < url2
+
+
+def test_host_precedence():
+    literal = PatternUrl('a', host='www.example.com')
+    pattern = PatternUrl('a', host='{tenant}.example.com')
+    nohost = PatternUrl('a')
+    assert literal < pattern < nohost
+    assert not (nohost < literal)
+    assert not literal.equals(nohost)
+    assert pattern.equals(PatternUrl('a', host='{other}.example.com'))
+    assert literal.sort_key < pattern.sort_key < nohost.sort_key
+
+
+def test_path_precedes_host():
+    url1 = PatternUrl('a/b')
+    url2 = PatternUrl('a/{b}', host='www.example.com')
+    assert url1 < url2